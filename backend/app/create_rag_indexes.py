@@ -1,6 +1,9 @@
 # create_rag_indexes.py
 
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
 from dotenv import load_dotenv
 from pinecone import Pinecone, ServerlessSpec
 
@@ -14,13 +17,8 @@ pc = Pinecone(api_key=PINECONE_API_KEY)
 # MUST MATCH embedding model dimension
 EMBEDDING_DIMENSION = 1536  # for text-embedding-3-small
 
-def create_index_if_not_exists(index_name: str):
-    existing = [i["name"] for i in pc.list_indexes()]
-
-    if index_name in existing:
-        print(f"✅ Index '{index_name}' already exists.")
-        return
 
+def _create_index(index_name: str):
     pc.create_index(
         name=index_name,
         dimension=EMBEDDING_DIMENSION,
@@ -33,6 +31,27 @@ def create_index_if_not_exists(index_name: str):
 
     print(f"🚀 Created index '{index_name}'")
 
+
+def create_indexes_if_not_exist(index_names: List[str]):
+    # One list_indexes round trip for all names (it used to run once per
+    # index), and missing indexes are created in parallel so their
+    # provisioning waits overlap instead of running back to back.
+    existing = {i["name"] for i in pc.list_indexes()}
+
+    missing = []
+    for index_name in index_names:
+        if index_name in existing:
+            print(f"✅ Index '{index_name}' already exists.")
+        else:
+            missing.append(index_name)
+
+    if not missing:
+        return
+
+    with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+        # list() propagates any creation failure
+        list(pool.map(_create_index, missing))
+
+
 if __name__ == "__main__":
-    create_index_if_not_exists("clinic-knowledge")
-    create_index_if_not_exists("dental-knowledge")
+    create_indexes_if_not_exist(["clinic-knowledge", "dental-knowledge"])
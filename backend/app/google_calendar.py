@@ -2,7 +2,11 @@
 
 from __future__ import annotations
 
+import bisect
+import functools
+import logging
 import os
+import threading
 from datetime import datetime, timedelta, timezone
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -15,6 +19,8 @@ from typing import List, Tuple
 
 
 
+logger = logging.getLogger(__name__)
+
 CALENDAR_ID = os.getenv("GOOGLE_CALENDAR_ID", "primary")
 
 # ENV CONFIG
@@ -49,10 +55,20 @@ def _to_rfc3339_utc(dt: datetime) -> str:
     return dt_utc.isoformat()
 
 
+# Guard the token refresh path so concurrent requests don't race on
+# writing token.json.
+_token_refresh_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
 def get_calendar_service():
     """
     Build and return an authenticated Google Calendar service.
 
+    Cached per-process: previously every calendar helper re-read
+    token.json, re-parsed it and rebuilt the discovery client on each call
+    (up to 11 times per request inside find_alternative_slots).
+
     Precondition: backend/token.json already exists (generated once via OAuth).
     """
     if not os.path.exists(TOKEN_PATH):
@@ -65,11 +81,14 @@ def get_calendar_service():
 
     # Refresh token if expired
     if creds and creds.expired and creds.refresh_token:
-        creds.refresh(Request())
-        with open(TOKEN_PATH, "w", encoding="utf-8") as f:
-            f.write(creds.to_json())
-
-    service = build("calendar", "v3", credentials=creds)
+        with _token_refresh_lock:
+            creds.refresh(Request())
+            with open(TOKEN_PATH, "w", encoding="utf-8") as f:
+                f.write(creds.to_json())
+
+    # static_discovery uses the discovery doc bundled with the client
+    # library instead of fetching it over the network.
+    service = build("calendar", "v3", credentials=creds, static_discovery=True)
     return service
 
 
@@ -97,33 +116,34 @@ def is_slot_free(start: datetime, end: datetime) -> bool:
             timeMax=time_max,
             singleEvents=True,
             orderBy="startTime",
+            # Partial response: we only need start/end to detect overlap,
+            # and one timed event is enough to mark the slot busy.
+            maxResults=10,
+            fields="items(start/dateTime,end/dateTime)",
         )
         .execute()
     )
 
     items = events_result.get("items", []) or []
 
-    # 🔍 Filter out all-day events – we only care about ones with 'dateTime'
-    timed_events = []
-    for ev in items:
-        start_info = ev.get("start", {})
-        end_info = ev.get("end", {})
-        if "dateTime" in start_info or "dateTime" in end_info:
-            timed_events.append(ev)
-
-    # 🔥 Debug logging so you can see what's going on
-    print(">>> is_slot_free called")
-    print(f"    time_min: {time_min}")
-    print(f"    time_max: {time_max}")
-    print(f"    total events returned: {len(items)}")
-    print(f"    timed events considered: {len(timed_events)}")
-    for ev in timed_events:
-        print("    - summary:", ev.get("summary"))
-        print("      start:", ev.get("start"))
-        print("      end  :", ev.get("end"))
-
-    # Slot is free if there are no timed events overlapping
-    return len(timed_events) == 0
+    # Slot is busy if any *timed* event overlaps; all-day events (only
+    # 'date', no 'dateTime') are ignored. any() short-circuits on the
+    # first busy event instead of materializing a filtered list.
+    busy = any(
+        "dateTime" in ev.get("start", {}) or "dateTime" in ev.get("end", {})
+        for ev in items
+    )
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "is_slot_free time_min=%s time_max=%s events=%d busy=%s",
+            time_min,
+            time_max,
+            len(items),
+            busy,
+        )
+
+    return not busy
 
 
 # Same working hours as agent.py (keep in sync manually)
@@ -150,18 +170,62 @@ def _is_within_working_hours_local(dt: datetime) -> bool:
     return True
 
 
-def find_alternative_slots(
+def get_busy_intervals(
+    window_start: datetime,
+    window_end: datetime,
+) -> List[Tuple[datetime, datetime]]:
+    """
+    Fetch all busy intervals in [window_start, window_end) with a single
+    freebusy query, so callers can do overlap checks in memory instead of
+    one events().list call per candidate slot.
+    """
+    service = get_calendar_service()
+
+    body = {
+        "timeMin": _to_rfc3339_utc(window_start),
+        "timeMax": _to_rfc3339_utc(window_end),
+        "items": [{"id": GOOGLE_CALENDAR_ID}],
+    }
+
+    result = service.freebusy().query(body=body).execute()
+    busy = result["calendars"][GOOGLE_CALENDAR_ID]["busy"]
+
+    return [
+        (
+            datetime.fromisoformat(b["start"].replace("Z", "+00:00")),
+            datetime.fromisoformat(b["end"].replace("Z", "+00:00")),
+        )
+        for b in busy
+    ]
+
+
+def _overlaps_busy(
+    start: datetime,
+    end: datetime,
+    busy_intervals: List[Tuple[datetime, datetime]],
+    busy_starts: List[datetime],
+) -> bool:
+    """
+    Overlap check against sorted busy intervals via binary search.
+    freebusy returns merged, non-overlapping intervals, so the interval
+    with the greatest start before `end` is the only one that can overlap.
+    """
+    idx = bisect.bisect_left(busy_starts, end) - 1
+    return idx >= 0 and busy_intervals[idx][1] > start
+
+
+def _scan_free_slots(
     requested_start: datetime,
-    duration_minutes: int = 30,
-    max_suggestions: int = 4,
+    busy_intervals: List[Tuple[datetime, datetime]],
+    busy_starts: List[datetime],
+    slot_delta: timedelta,
+    max_suggestions: int,
 ) -> List[Tuple[datetime, datetime]]:
     """
-    Find up to `max_suggestions` nearby free slots around the requested_start,
-    using Google Calendar availability, but only within clinic working hours.
+    In-memory scan of candidate slots around requested_start against
+    already-fetched busy intervals.
     """
     now_ist = datetime.now(IST)
-    slot_delta = timedelta(minutes=duration_minutes)
-
     suggestions: List[Tuple[datetime, datetime]] = []
 
     for i in range(-2, 9):
@@ -179,12 +243,8 @@ def find_alternative_slots(
         if not (_is_within_working_hours_local(candidate_start) and _is_within_working_hours_local(candidate_end)):
             continue
 
-        try:
-            if is_slot_free(candidate_start, candidate_end):
-                suggestions.append((candidate_start, candidate_end))
-        except Exception as e:
-            print(">>> find_alternative_slots: is_slot_free error:", repr(e))
-            continue
+        if not _overlaps_busy(candidate_start, candidate_end, busy_intervals, busy_starts):
+            suggestions.append((candidate_start, candidate_end))
 
         if len(suggestions) >= max_suggestions:
             break
@@ -192,6 +252,77 @@ def find_alternative_slots(
     return suggestions
 
 
+def _fetch_window_busy(
+    requested_start: datetime,
+    slot_delta: timedelta,
+) -> Tuple[List[Tuple[datetime, datetime]], List[datetime]]:
+    """
+    One freebusy query covering the candidate window
+    (requested_start - 2 slots .. + 8 slots), sorted for binary search.
+    """
+    window_start = requested_start - 2 * slot_delta
+    window_end = requested_start + 9 * slot_delta
+
+    busy_intervals = get_busy_intervals(window_start, window_end)
+    busy_intervals.sort()
+    busy_starts = [b_start for b_start, _ in busy_intervals]
+    return busy_intervals, busy_starts
+
+
+def check_slot_with_alternatives(
+    requested_start: datetime,
+    duration_minutes: int = 30,
+    max_suggestions: int = 4,
+) -> Tuple[bool, List[Tuple[datetime, datetime]]]:
+    """
+    Answer 'is the requested slot free?' and, if not, 'which nearby slots
+    are?' from a SINGLE freebusy query — one round trip where the booking
+    path previously made two (events().list, then freebusy).
+
+    Returns (slot_free, suggestions); suggestions is empty when the slot
+    is free.
+    """
+    requested_start = _ensure_ist(requested_start)
+    slot_delta = timedelta(minutes=duration_minutes)
+
+    busy_intervals, busy_starts = _fetch_window_busy(requested_start, slot_delta)
+
+    if not _overlaps_busy(
+        requested_start, requested_start + slot_delta, busy_intervals, busy_starts
+    ):
+        return True, []
+
+    return False, _scan_free_slots(
+        requested_start, busy_intervals, busy_starts, slot_delta, max_suggestions
+    )
+
+
+def find_alternative_slots(
+    requested_start: datetime,
+    duration_minutes: int = 30,
+    max_suggestions: int = 4,
+) -> List[Tuple[datetime, datetime]]:
+    """
+    Find up to `max_suggestions` nearby free slots around the requested_start,
+    using Google Calendar availability, but only within clinic working hours.
+
+    Availability for the whole candidate window comes from ONE freebusy
+    query; the per-candidate check is then a pure in-memory overlap scan.
+    """
+    requested_start = _ensure_ist(requested_start)
+    slot_delta = timedelta(minutes=duration_minutes)
+
+    try:
+        busy_intervals, busy_starts = _fetch_window_busy(requested_start, slot_delta)
+    except Exception as e:
+        print(">>> find_alternative_slots: freebusy error:", repr(e))
+        return []
+
+    return _scan_free_slots(
+        requested_start, busy_intervals, busy_starts, slot_delta, max_suggestions
+    )
+
+
 
 
 
@@ -235,26 +366,25 @@ def update_calendar_event(stored: StoredAppointment) -> str:
     """
     Move an existing Google Calendar event to stored.start_time / stored.end_time.
     Does NOT create a new event.
+
+    Uses events().patch() so only the changed start/end fields travel —
+    one round trip, where the old get-then-update pair cost two (and
+    re-uploaded the whole event body). A missing event still fails the
+    same way: patch 404s just like get did.
     """
     if not stored.google_event_id:
         raise ValueError("Cannot update calendar event: google_event_id is missing.")
 
     service = get_calendar_service()
 
-    # Fetch existing event
-    event = service.events().get(
+    updated = service.events().patch(
         calendarId=CALENDAR_ID,
         eventId=stored.google_event_id,
-    ).execute()
-
-    # Update start/end times
-    event["start"]["dateTime"] = stored.start_time.isoformat()
-    event["end"]["dateTime"] = stored.end_time.isoformat()
-
-    updated = service.events().update(
-        calendarId=CALENDAR_ID,
-        eventId=stored.google_event_id,
-        body=event,
+        body={
+            "start": {"dateTime": stored.start_time.isoformat()},
+            "end": {"dateTime": stored.end_time.isoformat()},
+        },
+        fields="id",
     ).execute()
 
     # Return event id (unchanged, but kept for consistency)
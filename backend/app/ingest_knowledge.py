@@ -0,0 +1,274 @@
+# ingest_knowledge.py
+#
+# Unified ingestion for all RAG corpora. Replaces the two near-identical
+# ingest_clinic_knowledge.py / ingest_general_dental_knowledge.py scripts:
+# one embedding helper, one connection pool, one on-disk cache, and a
+# single parameterized ingest() routine shared by every corpus.
+
+import functools
+import hashlib
+import json
+import os
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+from knowledge_docs import CLINIC_DOCS, GENERAL_DENTAL_DOCS
+
+# -------------------------------------------------
+# Setup
+# -------------------------------------------------
+
+load_dotenv()
+
+OPENROUTER_EMBEDDING_URL = "https://openrouter.ai/api/v1/embeddings"
+EMBEDDING_MODEL = "openai/text-embedding-3-small"
+
+# One pooled session for all embedding calls: TCP+TLS connections are
+# reused across sequential calls and shared by the fallback thread pool.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=16),
+)
+
+
+@functools.cache
+def _get_headers() -> Dict[str, str]:
+    """
+    Resolve the API key lazily (and once), so importing this module —
+    e.g. to reuse the doc list — doesn't require OPENROUTER_API_KEY.
+    """
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENROUTER_API_KEY not set")
+
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+
+# -------------------------------------------------
+# Embedding helper (OpenRouter)
+# -------------------------------------------------
+
+# OpenAI-style embedding endpoints accept a list for "input",
+# so N docs cost one HTTP round-trip instead of N.
+EMBED_BATCH_LIMIT = 2048
+
+# On-disk embedding cache: re-running ingestion only pays API cost for
+# docs whose text actually changed. Keyed by model + content hash.
+EMBED_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".embed_cache"
+)
+
+
+def _cache_path(text: str) -> str:
+    key = hashlib.sha256((EMBEDDING_MODEL + "\x00" + text).encode()).hexdigest()
+    return os.path.join(EMBED_CACHE_DIR, f"{key}.json")
+
+
+def _cache_get(text: str):
+    path = _cache_path(text)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _cache_put(text: str, embedding: List[float]) -> None:
+    os.makedirs(EMBED_CACHE_DIR, exist_ok=True)
+    with open(_cache_path(text), "w", encoding="utf-8") as f:
+        json.dump(embedding, f)
+
+
+def _embed_one(text: str) -> List[float]:
+    response = _SESSION.post(
+        OPENROUTER_EMBEDDING_URL,
+        headers=_get_headers(),
+        json={
+            "model": EMBEDDING_MODEL,
+            "input": text,
+        },
+        timeout=30,
+    )
+
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"Embedding failed ({response.status_code}): {response.text}"
+        )
+
+    return response.json()["data"][0]["embedding"]
+
+
+def _embed_chunk(chunk: List[str]) -> List[List[float]]:
+    response = _SESSION.post(
+        OPENROUTER_EMBEDDING_URL,
+        headers=_get_headers(),
+        json={
+            "model": EMBEDDING_MODEL,
+            "input": chunk,
+        },
+        timeout=30,
+    )
+
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"Embedding failed ({response.status_code}): {response.text}"
+        )
+
+    data = response.json()
+    # Map results back to inputs by index (order is not guaranteed)
+    ordered = sorted(data["data"], key=lambda d: d["index"])
+    return [d["embedding"] for d in ordered]
+
+
+def embed_batch(texts: List[str]) -> List[List[float]]:
+    # Serve cache hits first; only cache misses hit the API
+    embeddings: List = [_cache_get(t) for t in texts]
+    missing = [i for i, e in enumerate(embeddings) if e is None]
+
+    for start in range(0, len(missing), EMBED_BATCH_LIMIT):
+        idx_chunk = missing[start:start + EMBED_BATCH_LIMIT]
+        chunk = [texts[i] for i in idx_chunk]
+        try:
+            fresh = _embed_chunk(chunk)
+        except RuntimeError:
+            # Some proxied embedding models reject list input. Fall back
+            # to one call per text, but run them concurrently so wall
+            # time is ~one round-trip instead of the sum of all of them.
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                fresh = list(pool.map(_embed_one, chunk))
+
+        for i, embedding in zip(idx_chunk, fresh):
+            embeddings[i] = embedding
+            _cache_put(texts[i], embedding)
+
+    return embeddings
+
+# -------------------------------------------------
+# Ingestion logic
+# -------------------------------------------------
+
+def _upsert_in_batches(index, vectors: List[Dict], namespace: str, batch_size: int = 200) -> None:
+    """
+    Upsert vectors in capped batches with parallel in-flight requests
+    (async_req), per Pinecone's bulk-ingest guidance. A wash for today's
+    corpus size, but the throughput pattern is in place before it grows.
+    """
+    # Safe to import here: the caller already imported pinecone_client
+    # to obtain `index`, so this is a sys.modules hit, not a fresh load.
+    from pinecone_client import wait_for_upsert
+
+    async_results = [
+        index.upsert(
+            vectors=vectors[i:i + batch_size],
+            namespace=namespace,
+            async_req=True,
+        )
+        for i in range(0, len(vectors), batch_size)
+    ]
+
+    # Propagate any failure before reporting success
+    for result in async_results:
+        wait_for_upsert(result)
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def no_prices(doc: Dict, text: str) -> None:
+    """Safety check: no prices allowed in general knowledge."""
+    if "₹" in text:
+        raise ValueError(
+            f"❌ Price detected in general dental knowledge doc: {doc['id']}"
+        )
+
+
+def ingest(
+    docs: List[Dict],
+    index,
+    namespace: str,
+    validators: Tuple[Callable[[Dict, str], None], ...] = (),
+) -> int:
+    """
+    Embed and upsert one corpus into the given index/namespace.
+    Returns the number of vectors ingested.
+    """
+    # Collect texts first (safety checks up-front) so all docs go through
+    # one batched embed call
+    to_ingest = []
+    for doc in docs:
+        text = doc["text"].strip()
+        if not text:
+            continue
+
+        for validate in validators:
+            validate(doc, text)
+
+        to_ingest.append((doc, text))
+
+    if not to_ingest:
+        print(f"❌ No {namespace} documents to ingest.")
+        return 0
+
+    # Change detection: docs whose stored content_hash matches are
+    # skipped entirely (no embed call, no upsert), making re-ingest
+    # incremental.
+    try:
+        fetched = index.fetch(
+            ids=[doc["id"] for doc, _ in to_ingest],
+            namespace=namespace,
+        )
+        existing = fetched.vectors
+    except Exception as e:
+        print(f">>> change-detection fetch failed ({e!r}); ingesting all docs")
+        existing = {}
+
+    changed = []
+    skipped = 0
+    for doc, text in to_ingest:
+        prior = existing.get(doc["id"])
+        prior_md = getattr(prior, "metadata", None) or {}
+        if prior_md.get("content_hash") == _content_hash(text):
+            skipped += 1
+            continue
+        changed.append((doc, text))
+
+    if not changed:
+        print(f"✅ {namespace}: {skipped} documents unchanged; nothing to ingest.")
+        return 0
+
+    embeddings = embed_batch([text for _, text in changed])
+
+    vectors = []
+    for (doc, text), embedding in zip(changed, embeddings):
+        md = doc["metadata"].copy()
+        md["text"] = text
+        md["content_hash"] = _content_hash(text)
+        vectors.append({
+            "id": doc["id"],
+            "values": embedding,
+            "metadata": md
+        })
+
+    _upsert_in_batches(index, vectors, namespace=namespace)
+
+    print(
+        f"✅ Ingested {len(vectors)} {namespace} knowledge chunks "
+        f"({skipped} unchanged, skipped)."
+    )
+    return len(vectors)
+
+# -------------------------------------------------
+# Run
+# -------------------------------------------------
+
+if __name__ == "__main__":
+    from pinecone_client import clinic_index, general_index
+
+    ingest(CLINIC_DOCS, clinic_index, namespace="clinic")
+    ingest(GENERAL_DENTAL_DOCS, general_index, namespace="general", validators=(no_prices,))
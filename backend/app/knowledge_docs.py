@@ -0,0 +1,114 @@
+# knowledge_docs.py
+#
+# Static knowledge corpora for RAG ingestion. Kept as plain data so other
+# modules can import the doc lists without pulling in embedding/Pinecone
+# setup.
+
+from typing import Dict, List
+
+# -------------------------------------------------
+# Clinic knowledge documents
+# -------------------------------------------------
+
+CLINIC_DOCS: List[Dict] = [
+    {
+        "id": "cleaning_pricing",
+        "text": "Teeth cleaning at our clinic costs between ₹800 and ₹1,200 and typically takes 30 to 45 minutes.",
+        "metadata": {
+            "type": "clinic_info",
+            "category": "pricing",
+            "service": "cleaning",
+            "source": "clinic_internal"
+        }
+    },
+    {
+        "id": "clinic_hours",
+        "text": (
+            "The clinic operates Monday to Saturday from 9:00 AM to 1:00 PM "
+            "and from 2:00 PM to 6:00 PM. The clinic is closed on Sundays."
+        ),
+        "metadata": {
+            "type": "clinic_info",
+            "category": "hours",
+            "source": "clinic_internal"
+        }
+    },
+    {
+        "id": "cancellation_policy",
+        "text": (
+            "Appointments can be cancelled free of charge up to 24 hours before "
+            "the scheduled time. Late cancellations may incur a ₹500 fee."
+        ),
+        "metadata": {
+            "type": "clinic_info",
+            "category": "policy",
+            "source": "clinic_internal"
+        }
+    },
+    {
+        "id": "doctor_ramesh",
+        "text": (
+            "Dr. Ramesh is a senior dentist at the clinic and speaks English and Kannada."
+        ),
+        "metadata": {
+            "type": "clinic_info",
+            "category": "doctor",
+            "source": "clinic_internal"
+        }
+    },
+]
+
+# -------------------------------------------------
+# External dental knowledge documents
+# -------------------------------------------------
+
+GENERAL_DENTAL_DOCS: List[Dict] = [
+    {
+        "id": "what_is_teeth_cleaning",
+        "text": (
+            "Teeth cleaning is a professional dental procedure that removes plaque, "
+            "tartar, and stains from teeth to help prevent cavities and gum disease."
+        ),
+        "metadata": {
+            "type": "educational",
+            "topic": "cleaning",
+            "source": "trusted_public"
+        }
+    },
+    {
+        "id": "how_often_cleaning",
+        "text": (
+            "Most dentists recommend having a professional teeth cleaning every six months, "
+            "although some people may need more frequent cleanings."
+        ),
+        "metadata": {
+            "type": "educational",
+            "topic": "cleaning",
+            "source": "trusted_public"
+        }
+    },
+    {
+        "id": "xray_safety",
+        "text": (
+            "Dental X-rays are generally considered safe and use very low levels of radiation. "
+            "They help dentists detect problems that may not be visible during a regular exam."
+        ),
+        "metadata": {
+            "type": "educational",
+            "topic": "xray",
+            "source": "trusted_public"
+        }
+    },
+    {
+        "id": "what_is_plaque",
+        "text": (
+            "Plaque is a sticky film of bacteria that forms on teeth. If not removed regularly, "
+            "it can lead to tooth decay and gum disease."
+        ),
+        "metadata": {
+            "type": "educational",
+            "topic": "plaque",
+            "source": "trusted_public"
+        }
+    },
+]
@@ -1,14 +1,19 @@
 from __future__ import annotations
-import tiktoken
+import atexit
+import functools
+import queue
+import threading
+import time
 import os
 import re
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
-from typing import Any, Dict, Tuple, Optional, List
+from typing import Annotated, Any, Dict, Tuple, Optional, List
 
-from dateutil import parser
 from dotenv import load_dotenv
-from pydantic import BaseModel, Field, field_validator, EmailStr
+from pydantic import AfterValidator, BaseModel, ConfigDict, Field, field_validator, EmailStr
 from pydantic_ai import Agent, RunContext
 from pydantic_ai.models.openai import OpenAIChatModel
 from pydantic_ai.providers.openai import OpenAIProvider
@@ -22,9 +27,11 @@ from app.models import StoredAppointment, UserProfile
 from app.persistence import (
     save_stored_appointment,
     save_user,
+    save_user_and_appointment,
     get_latest_confirmed_future_appointment,
-    _clean_metadata,
+    get_appointment_by_id,
     get_user_metadata,
+    invalidate_user_cache,
     DUMMY_VECTOR
 
 )
@@ -34,26 +41,40 @@ from app.google_calendar import (
     update_calendar_event,
     cancel_calendar_event,
     find_alternative_slots,
+    check_slot_with_alternatives,
 )
 
 
+# Load .env exactly once, before any os.getenv below. (Previously this
+# ran further down the module, after OPENROUTER_API_KEY was already read
+# for the embedding client.)
+load_dotenv()
+
+
 # ---------------------------------------------------------
 # RAG utilities
 # ---------------------------------------------------------
 
+# Keyword lists built once at import so classify_rag_intent doesn't
+# rebuild them on every chat message.
+CLINIC_INTENT_KEYWORDS: tuple[str, ...] = (
+    "price", "cost", "fees", "clinic", "doctor", "insurance",
+    "timing", "hours", "policy", "refund", "parking",
+)
+
+GENERAL_INTENT_KEYWORDS: tuple[str, ...] = (
+    "what is", "why", "how often", "is it safe",
+    "plaque", "tartar", "cleaning", "whitening", "x-ray",
+)
+
+
 def classify_rag_intent(text: str) -> str:
     t = text.lower()
 
-    if any(k in t for k in [
-        "price", "cost", "fees", "clinic", "doctor", "insurance",
-        "timing", "hours", "policy", "refund", "parking"
-    ]):
+    if any(k in t for k in CLINIC_INTENT_KEYWORDS):
         return "clinic"
 
-    if any(k in t for k in [
-        "what is", "why", "how often", "is it safe",
-        "plaque", "tartar", "cleaning", "whitening", "x-ray"
-    ]):
+    if any(k in t for k in GENERAL_INTENT_KEYWORDS):
         return "general"
 
     return "none"
@@ -65,8 +86,17 @@ OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 EMBEDDING_MODEL = "openai/text-embedding-3-small"
 OPENROUTER_EMBED_URL = "https://openrouter.ai/api/v1/embeddings"
 
-def embed_query(text: str) -> list[float]:
-    response = requests.post(
+# Module-scope session so repeated embedding calls reuse one TCP/TLS
+# connection instead of handshaking per request.
+_embed_session = requests.Session()
+
+# Bounded concurrency for multi-batch embedding so total wall time is
+# roughly the slowest batch rather than the sum of all batches.
+EMBED_MAX_CONCURRENCY = 5
+
+
+def _embed_batch(batch: list[str]) -> list[list[float]]:
+    response = _embed_session.post(
         OPENROUTER_EMBED_URL,
         headers={
             "Authorization": f"Bearer {OPENROUTER_API_KEY}",
@@ -74,18 +104,103 @@ def embed_query(text: str) -> list[float]:
         },
         json={
             "model": EMBEDDING_MODEL,
-            "input": text,
+            "input": batch,
         },
         timeout=20,
     )
     response.raise_for_status()
-    return response.json()["data"][0]["embedding"]
+
+    # The API may reorder results; restore input order via index
+    data = sorted(response.json()["data"], key=lambda d: d["index"])
+    return [d["embedding"] for d in data]
+
+
+def embed_many(texts: list[str], batch_size: int = 256) -> list[list[float]]:
+    """
+    Embed several texts in batched requests (the embeddings endpoint
+    accepts `input` as a list). N texts cost ceil(N / batch_size) HTTP
+    round-trips instead of N, and multiple batches are issued in parallel
+    with bounded concurrency.
+    """
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    if not batches:
+        return []
+
+    if len(batches) == 1:
+        return _embed_batch(batches[0])
+
+    with ThreadPoolExecutor(max_workers=min(EMBED_MAX_CONCURRENCY, len(batches))) as pool:
+        results = list(pool.map(_embed_batch, batches))
+
+    return [embedding for batch_result in results for embedding in batch_result]
+
+
+@functools.lru_cache(maxsize=512)
+def embed_query(text: str) -> list[float]:
+    """
+    Embed a query via OpenRouter. Cached so repeated/identical questions
+    (common in a chat loop) skip the HTTP round-trip entirely.
+    """
+    return embed_many([text])[0]
+
+
+# ---------------------------------------------------------
+# Semantic query cache
+# ---------------------------------------------------------
+# Exact-string caching (lru_cache above) misses paraphrases like
+# "What is plaque?" vs "explain plaque". Since we already pay for the
+# query embedding, compare it against recent queries and reuse the stored
+# context when similarity is high enough — skipping the Pinecone queries.
+SEMANTIC_CACHE_THRESHOLD = 0.93
+SEMANTIC_CACHE_MAX = 256
+
+# [(embedding, context), ...] most recent last
+_semantic_cache: List[Tuple[list[float], list[str]]] = []
+
+
+def _cosine_similarity(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = sum(x * x for x in a) ** 0.5
+    norm_b = sum(y * y for y in b) ** 0.5
+    if norm_a == 0.0 or norm_b == 0.0:
+        return 0.0
+    return dot / (norm_a * norm_b)
+
+
+def _semantic_cache_lookup(embedding: list[float]) -> Optional[list[str]]:
+    best_sim = 0.0
+    best_context: Optional[list[str]] = None
+    for cached_emb, cached_context in _semantic_cache:
+        sim = _cosine_similarity(embedding, cached_emb)
+        if sim > best_sim:
+            best_sim = sim
+            best_context = cached_context
+    if best_sim >= SEMANTIC_CACHE_THRESHOLD:
+        return best_context
+    return None
+
+
+def _semantic_cache_store(embedding: list[float], context: list[str]) -> None:
+    _semantic_cache.append((embedding, context))
+    if len(_semantic_cache) > SEMANTIC_CACHE_MAX:
+        _semantic_cache.pop(0)
 
 
+@functools.lru_cache(maxsize=256)
 def retrieve_rag_context(query: str) -> list[str]:
     intent = classify_rag_intent(query)
+
+    if intent == "none":
+        return []
+
     embedding = embed_query(query)
 
+    # Paraphrase hit: reuse context retrieved for a similar question
+    cached = _semantic_cache_lookup(embedding)
+    if cached is not None:
+        return cached
+
     # 1️ Try clinic knowledge first
     if intent == "clinic":
         result = clinic_index.query(
@@ -101,31 +216,55 @@ def retrieve_rag_context(query: str) -> list[str]:
         ]
 
         if clinic_hits:
+            _semantic_cache_store(embedding, clinic_hits)
             return clinic_hits
 
     # 2️ Fallback to general dental knowledge
-    if intent in ("clinic", "general"):
-        result = general_index.query(
-            vector=embedding,
-            top_k=3,
-            namespace="general",
-            include_metadata=True,
-        )
+    result = general_index.query(
+        vector=embedding,
+        top_k=3,
+        namespace="general",
+        include_metadata=True,
+    )
 
-        return [
-            m["metadata"]["text"]
-            for m in result.get("matches", [])
-        ]
+    general_hits = [
+        m["metadata"]["text"]
+        for m in result.get("matches", [])
+    ]
 
-    return []
+    _semantic_cache_store(embedding, general_hits)
+    return general_hits
 
 
 #  ------------------------------------------------------
 #   To measure tokens
 #  ------------------------------------------------------
+@functools.lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    # Imported here, not at module scope: tiktoken pulls in and parses
+    # the full BPE rank table, and most workers never count tokens.
+    import tiktoken
+
+    # Building an encoder parses the full BPE rank table — do it once
+    # per model, not once per count_tokens call.
+    return tiktoken.encoding_for_model(model)
+
+
 def count_tokens(text: str, model: str = "gpt-4") -> int:
-    encoding = tiktoken.encoding_for_model(model)
-    return len(encoding.encode(text))
+    return len(_get_encoding(model).encode(text))
+
+
+def count_tokens_many(texts: List[str], model: str = "gpt-4") -> List[int]:
+    """
+    Token counts for several texts at once. encode_batch releases the
+    GIL in tiktoken's Rust core, so multi-message histories tokenize in
+    parallel instead of serially.
+    """
+    if not texts:
+        return []
+    encoding = _get_encoding(model)
+    encoded = encoding.encode_batch(texts, num_threads=min(8, len(texts)))
+    return [len(tokens) for tokens in encoded]
 
 
 # ---------------------------------------------------------
@@ -137,12 +276,6 @@ try:
 except Exception:
     KOLKATA = timezone(timedelta(hours=5, minutes=30))
 
-# Today's date in IST, used for prompt anchoring
-TODAY_IST = datetime.now(KOLKATA)
-TODAY_IST_STR = TODAY_IST.strftime("%d-%m-%Y")
-TODAY_IST_VERBOSE = TODAY_IST.strftime("%d %B %Y")
-
-
 # ---------------------------------------------------------
 #  Clinic working hours (IST)
 # ---------------------------------------------------------
@@ -151,44 +284,283 @@ CLINIC_LUNCH_START = 13 # 13:00 (1 PM)
 CLINIC_LUNCH_END = 14   # 14:00 (2 PM)
 CLINIC_CLOSE_HOUR = 18  # 18:00 (6 PM)
 
+# Minute-of-day bitmask of the working hours above, built once at
+# import: bit m is set iff minute m falls in an open interval. The
+# per-call check is then one shift-and-test on an int instead of float
+# division plus three comparisons.
+_WORKING_MINUTES_MASK = 0
+for _m in range(CLINIC_OPEN_HOUR * 60, CLINIC_LUNCH_START * 60):
+    _WORKING_MINUTES_MASK |= 1 << _m
+for _m in range(CLINIC_LUNCH_END * 60, CLINIC_CLOSE_HOUR * 60):
+    _WORKING_MINUTES_MASK |= 1 << _m
+del _m
+
+
+def _to_ist(dt: datetime) -> datetime:
+    """
+    Convert to IST, skipping the tzdata table walk when the datetime is
+    already KOLKATA-localized (the common case: parse_date_time output).
+    """
+    if dt.tzinfo is KOLKATA:
+        return dt
+    return dt.astimezone(KOLKATA)
+
+
+# Display formatting for the two fixed patterns used everywhere below
+# ("%d-%m-%Y" and "%I:%M %p"). f-strings over the datetime fields skip
+# strftime's format-string parse and locale machinery on every tool
+# response; output is byte-identical to the old strftime calls.
+
+def _fmt_date(dt: datetime) -> str:
+    return f"{dt.day:02d}-{dt.month:02d}-{dt.year}"
+
+
+def _fmt_time(dt: datetime) -> str:
+    return f"{dt.hour % 12 or 12:02d}:{dt.minute:02d} {'AM' if dt.hour < 12 else 'PM'}"
+
+
+def _fmt_when(dt: datetime) -> str:
+    return f"{_fmt_date(dt)} at {_fmt_time(dt)}"
+
 
 def is_within_working_hours(dt: datetime) -> bool:
     """
     Return True if the given datetime (any timezone) falls within
     clinic working hours in Asia/Kolkata, excluding lunch break.
     """
-    local = dt.astimezone(KOLKATA)
-    h = local.hour + local.minute / 60.0
+    local = _to_ist(dt)
+    return bool(_WORKING_MINUTES_MASK >> (local.hour * 60 + local.minute) & 1)
 
-    if h < CLINIC_OPEN_HOUR or h >= CLINIC_CLOSE_HOUR:
-        return False
 
-    # Exclude lunch break
-    if CLINIC_LUNCH_START <= h < CLINIC_LUNCH_END:
-        return False
+# Compiled once at import — previously re.sub rebuilt the pattern on
+# every validator call.
+_ORDINAL_RE = re.compile(r"(\d+)(st|nd|rd|th)\b")
 
-    return True
+# 10-digit Indian mobile number starting with 6-9
+_PHONE_RE = re.compile(r"[6-9]\d{9}")  # matched with fullmatch, so no anchors needed
 
 
 def _normalize_input(s: str) -> str:
     s = (s or "").strip().lower()
-    s = re.sub(r"(\d+)(st|nd|rd|th)\b", r"\1", s)
+    s = _ORDINAL_RE.sub(r"\1", s)
     s = s.replace(",", "")
     return s
 
 
+# Shared parser state built once: dateutil otherwise constructs a fresh
+# parserinfo on every parse call. dayfirst is fixed project-wide
+# (DD-MM-YYYY). dateutil itself is imported lazily — the fast paths
+# (regex/strptime/ISO) handle everything the LLM normally emits, so most
+# processes never touch it.
+
+
+@functools.lru_cache(maxsize=1)
+def _parser_info():
+    from dateutil import parser
+    return parser.parserinfo(dayfirst=True)
+
+# The accepted formats are a small finite set; trying strptime against a
+# whitelist is far cheaper than dateutil's reflection-driven fuzzy parser,
+# which stays as the fallback for anything unusual.
+_DATE_FORMATS = ("%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d")
+_TIME_FORMATS = ("%I:%M %p", "%I %p", "%I%p", "%H:%M", "%H")
+
+# Bottom rung for time parsing: one regex covers everything the LLM
+# actually emits ('9 AM', '09:00', '3pm', '15:30') in a single match,
+# cheaper than looping strptime formats and far cheaper than dateutil.
+_TIME_RE = re.compile(r"^\s*(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\s*$", re.IGNORECASE)
+
+
+def _strptime_any(s: str, formats: tuple[str, ...]) -> Optional[datetime]:
+    for fmt in formats:
+        try:
+            return datetime.strptime(s, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+@functools.lru_cache(maxsize=512)
+def _parse_fuzzy(s: str) -> datetime:
+    """
+    Cached wrapper for dateutil's fuzzy parser, which rebuilds its parser
+    state per call. The LLM repeats the same date strings constantly
+    ('tomorrow', '21-03-2026', ...), so hits skip the parse entirely.
+    Whitelisted explicit formats and ISO-8601 take cheap fast paths.
+    """
+    dt = _strptime_any(s, _DATE_FORMATS)
+    if dt is not None:
+        return dt
+    try:
+        return datetime.fromisoformat(s)
+    except ValueError:
+        pass
+    from dateutil import parser
+    return parser.parse(s, parserinfo=_parser_info(), fuzzy=True)
+
+
+def _parse_time_str(v: str) -> datetime:
+    """
+    Parse the time formats the LLM actually emits ('9 AM', '09:00',
+    '3pm', '15:30') with a single regex, falling back to strptime and
+    then dateutil for anything unusual.
+    """
+    m = _TIME_RE.match(v)
+    if m:
+        hh = int(m.group(1))
+        mm = int(m.group(2) or 0)
+        ampm = m.group(3)
+        if ampm:
+            hh %= 12
+            if ampm.lower() == "pm":
+                hh += 12
+        if hh < 24 and mm < 60:
+            return datetime(1900, 1, 1, hh, mm)
+
+    dt = _strptime_any(v.strip(), _TIME_FORMATS)
+    if dt is not None:
+        return dt
+    from dateutil import parser
+    return parser.parse(v, fuzzy=True)
+
+
+# ---------------------------------------------------------
+#  Background write-behind queue for Pinecone persistence
+# ---------------------------------------------------------
+# Google Calendar holds the authoritative event; the Pinecone copies are
+# not needed to build the user-facing confirmation, so they're applied
+# off the request path by a daemon worker.
+_write_queue: queue.Queue = queue.Queue()
+
+
+def _write_worker() -> None:
+    while True:
+        fn, args = _write_queue.get()
+        try:
+            fn(*args)
+        except Exception as e:
+            print(">>> background persistence write failed:", repr(e))
+        finally:
+            _write_queue.task_done()
+
+
+_write_thread = threading.Thread(
+    target=_write_worker, name="pinecone-write-behind", daemon=True
+)
+_write_thread.start()
+
+
+def flush_writes() -> None:
+    """
+    Block until all queued persistence writes have been applied.
+    Used by tests and registered for graceful shutdown.
+    """
+    _write_queue.join()
+
+
+atexit.register(flush_writes)
+
+# Small pool for overlapping independent network calls inside one tool
+# invocation: prefetching Pinecone lookups while parsing/validation runs
+# (reschedule_appointment) and running the Calendar delete alongside the
+# Pinecone status write (cancel_appointment).
+_io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="agent-io")
+
+
 # ---------------------------------------------------------
-#  Tracks how many times the user sent inappropriate content
+#  Short-TTL availability cache
 # ---------------------------------------------------------
-_violation_state: Dict[str, int] = {"count": 0}
+# Users iterating over times with the LLM re-check the same slots within
+# seconds; cache the busy/free answer per (start, end) briefly so repeat
+# checks skip the Google Calendar round-trip. A just-booked slot is
+# marked busy immediately so the cache never re-offers it.
+SLOT_CACHE_TTL_SECONDS = 30.0
+
+_slot_cache: Dict[Tuple[str, str], Tuple[bool, float]] = {}
+
+
+def _is_slot_free_cached(start_dt: datetime, end_dt: datetime) -> bool:
+    key = (start_dt.isoformat(), end_dt.isoformat())
+    now = time.time()
+
+    cached = _slot_cache.get(key)
+    if cached is not None and cached[1] > now:
+        return cached[0]
 
+    result = is_slot_free(start_dt, end_dt)
+    _slot_cache[key] = (result, now + SLOT_CACHE_TTL_SECONDS)
+    return result
 
-def reset_violation_state() -> None:
+
+def _check_slot_cached(
+    start_dt: datetime, end_dt: datetime
+) -> Tuple[bool, List[Tuple[datetime, datetime]]]:
     """
-    Reset the moderation violation counter.
-    Call this from /reset so new sessions start clean.
+    Availability plus alternatives for the booking path. A fresh cache
+    hit on a free slot costs no round trip; everything else is exactly
+    one freebusy query (check_slot_with_alternatives answers both
+    questions, where the old path made two calls on the busy branch).
     """
-    _violation_state["count"] = 0
+    key = (start_dt.isoformat(), end_dt.isoformat())
+    now = time.time()
+
+    cached = _slot_cache.get(key)
+    if cached is not None and cached[1] > now:
+        if cached[0]:
+            return True, []
+        # Known busy: still need fresh alternatives (one freebusy call)
+        return False, find_alternative_slots(
+            start_dt, duration_minutes=30, max_suggestions=4
+        )
+
+    free, alternatives = check_slot_with_alternatives(
+        start_dt, duration_minutes=30, max_suggestions=4
+    )
+    _slot_cache[key] = (free, now + SLOT_CACHE_TTL_SECONDS)
+    return free, alternatives
+
+
+def _mark_slot_booked(start_dt: datetime, end_dt: datetime) -> None:
+    key = (start_dt.isoformat(), end_dt.isoformat())
+    _slot_cache[key] = (False, time.time() + 60.0)
+
+
+# Two concurrent bookings for the same slot can both see it free and
+# both create a calendar event (check and create are separate round
+# trips). Serialize that window per slot with an in-process lock; the
+# loser of the race then re-checks and sees the slot busy. In-process
+# covers the single-worker deployment this app runs as — a shared lock
+# store would be needed if it ever scales past one process.
+_slot_locks_guard = threading.Lock()
+_slot_locks: Dict[Tuple[str, str], threading.Lock] = {}
+
+
+def _slot_lock(start_dt: datetime, end_dt: datetime) -> threading.Lock:
+    # Entries are never evicted: an "unheld" lock may already have been
+    # handed to a caller that hasn't acquired it yet, so dropping it
+    # would let a second caller mint a fresh lock for the same slot and
+    # reopen the double-booking race. The table only grows by distinct
+    # slots ever requested — a few dozen bytes per half-hour grid slot —
+    # which is a fine price for a lock that is actually exclusive.
+    key = (start_dt.isoformat(), end_dt.isoformat())
+    with _slot_locks_guard:
+        return _slot_locks.setdefault(key, threading.Lock())
+
+
+# ---------------------------------------------------------
+#  Per-session agent state
+# ---------------------------------------------------------
+@dataclass
+class SessionDeps:
+    """
+    Mutable per-session state threaded through RunContext.deps.
+
+    Replaces the old module-global violation counter, which made every
+    user share (and poison) one moderation count under concurrency.
+    /chat owns one SessionDeps per session_id; dropping it on /reset
+    starts the session clean.
+    """
+    violations: int = 0
 
 
 # ---------------------------------------------------------
@@ -199,6 +571,41 @@ WEEKDAYS = {
     "friday": 4, "saturday": 5, "sunday": 6
 }
 
+# Precompiled once — resolve_natural_date_phrase runs inside the date
+# validators on every tool call.
+_IN_DAYS_RE = re.compile(r"\bin\s+(\d{1,3})\s+days?\b")
+_NEXT_WEEKDAY_RE = re.compile(r"\bnext\s+(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b")
+_WEEKDAY_RE = re.compile(r"\b(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b")
+
+
+@functools.lru_cache(maxsize=512)
+def _resolve_day_offset(s: str, today_weekday: int) -> Optional[int]:
+    """
+    Day offset for a normalized phrase, or None if it cannot resolve.
+    Every phrase reduces to an offset that depends only on the phrase and
+    today's weekday, so caching on that pair skips the regex scans for
+    repeated phrases ('tomorrow', 'next monday', ...) within a session
+    and stays correct across day boundaries.
+    """
+    if s == "today":
+        return 0
+    if s == "tomorrow":
+        return 1
+    if s in ("day after tomorrow", "day after", "dayaftertomorrow"):
+        return 2
+
+    m = _IN_DAYS_RE.search(s)
+    if m:
+        return int(m.group(1))
+
+    m2 = _NEXT_WEEKDAY_RE.search(s) or _WEEKDAY_RE.search(s)
+    if m2:
+        weekday = WEEKDAYS[m2.group(1)]
+        days_ahead = (weekday - today_weekday + 7) % 7
+        return days_ahead if days_ahead != 0 else 7
+
+    return None
+
 
 def resolve_natural_date_phrase(s: str, now: datetime) -> Optional[datetime]:
     """
@@ -215,36 +622,88 @@ def resolve_natural_date_phrase(s: str, now: datetime) -> Optional[datetime]:
     """
     if not s:
         return None
-    s = s.strip().lower()
 
-    if s == "today":
-        return now
-    if s == "tomorrow":
-        return now + timedelta(days=1)
-    if s in ("day after tomorrow", "day after", "dayaftertomorrow"):
-        return now + timedelta(days=2)
+    offset = _resolve_day_offset(s.strip().lower(), now.weekday())
+    if offset is None:
+        return None
+    return now + timedelta(days=offset)
 
-    m = re.search(r"\bin\s+(\d{1,3})\s+days?\b", s)
-    if m:
-        days = int(m.group(1))
-        return now + timedelta(days=days)
 
-    m2 = re.search(r"\bnext\s+(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b", s)
-    if m2:
-        weekday = WEEKDAYS[m2.group(1)]
-        days_ahead = (weekday - now.weekday() + 7) % 7
-        days_ahead = days_ahead if days_ahead != 0 else 7
-        return now + timedelta(days=days_ahead)
-
-    m3 = re.search(r"\b(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b", s)
-    if m3:
-        weekday = WEEKDAYS[m3.group(1)]
-        days_ahead = (weekday - now.weekday() + 7) % 7
-        if days_ahead == 0:
-            days_ahead = 7
-        return now + timedelta(days=days_ahead)
+# ---------------------------------------------------------
+#  Shared field-validator bodies
+# ---------------------------------------------------------
+# Appointment and RescheduleRequest validate dates/times identically;
+# one hot code path instead of two copy-pasted validator bodies.
 
-    return None
+def _validate_future_date(v: str, label: str = "Appointment") -> str:
+    """
+    Resolve a natural-language or explicit date to DD-MM-YYYY, enforcing
+    that it falls after today (IST). `label` only affects error wording.
+    """
+    # Keyed by today's date so cached answers expire at midnight. With
+    # agent.retries=3 the same date string is often re-validated within
+    # one turn; successful resolutions come straight from the memo
+    # (failures raise, which lru_cache never stores, so bad input is
+    # re-checked each time).
+    return _validate_future_date_memo(
+        _normalize_input(v), label, datetime.now(KOLKATA).date()
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def _validate_future_date_memo(s: str, label: str, _today) -> str:
+    now = datetime.now(KOLKATA)
+
+    # 1) Try resolver (handles 'tomorrow', 'in 3 days', weekdays, etc.)
+    resolved = resolve_natural_date_phrase(s, now)
+    if resolved is not None:
+        if resolved.date() <= now.date():
+            raise ValueError(f"{label} date must be after today's date.")
+        return _fmt_date(resolved)
+
+    # 2) Fallback to cached fuzzy parser
+    try:
+        dt = _parse_fuzzy(s)
+    except Exception as e:
+        raise ValueError(f"Could not parse date '{s}': {e}")
+
+    candidate = dt.replace(year=now.year)
+    if candidate.date() <= now.date():
+        candidate = candidate.replace(year=now.year + 1)
+    dt = candidate
+
+    if dt.date() <= now.date():
+        raise ValueError(f"{label} date must be after today's date.")
+
+    return _fmt_date(dt)
+
+
+def _validate_time(v: str) -> str:
+    """Normalize a flexible time string to 'HH:MM AM/PM'."""
+    try:
+        parsed = _parse_time_str(v)
+    except Exception:
+        raise ValueError(
+            f"Invalid time format: {v}. Please provide a valid time like 9 AM or 10:30 AM."
+        )
+    return _fmt_time(parsed)
+
+
+# Lookup/cancel/reschedule tools only need the email as a search key for
+# an address that already passed full EmailStr validation when it was
+# booked. A shape check on a precompiled regex keeps email-validator
+# (one of pydantic's heavier validators) off those per-tool-call paths;
+# Appointment keeps EmailStr so new bookings are still fully validated.
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def _fast_email_check(v: str) -> str:
+    if not _EMAIL_RE.match(v):
+        raise ValueError(f"Invalid email address: {v}")
+    return v
+
+
+LookupEmail = Annotated[str, AfterValidator(_fast_email_check)]
 
 
 # ---------------------------------------------------------
@@ -254,6 +713,11 @@ class Appointment(BaseModel):
     """
     Booking schema used by the LLM and FastAPI.
     """
+    # Rejecting unknown keys keeps the validation graph narrow (and
+    # surfaces LLM hallucinated fields as retries instead of silent
+    # drops); stripping whitespace spares the validators from doing it.
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
     name: str = Field(..., description="Patient's full name")
     preferred_date: str = Field(..., description="Appointment date in DD-MM-YYYY format or natural language")
     time: str = Field(..., description="Appointment time, flexible format")
@@ -278,33 +742,8 @@ class Appointment(BaseModel):
     @field_validator("preferred_date")
     @classmethod
     def validate_preferred_date(cls, v: str) -> str:
-        # Always interpret relative dates like 'tomorrow' in IST with helper, else parse.
-        now = datetime.now(KOLKATA)
-        s = _normalize_input(v)
-
-        # 1) Try resolver (handles 'tomorrow', 'in 3 days', weekdays, etc.)
-        resolved = resolve_natural_date_phrase(s, now)
-        if resolved is not None:
-            # enforce appointments must be after today
-            if resolved.date() <= now.date():
-                raise ValueError("Appointment date must be after today's date.")
-            return resolved.strftime("%d-%m-%Y")
-
-        # 2) Fallback to parser.parse
-        try:
-            dt = parser.parse(s, dayfirst=True, fuzzy=True)
-        except Exception as e:
-            raise ValueError(f"Could not parse date '{v}': {e}")
-
-        candidate = dt.replace(year=now.year)
-        if candidate.date() <= now.date():
-            candidate = candidate.replace(year=now.year + 1)
-        dt = candidate
-
-        if dt.date() <= now.date():
-            raise ValueError("Appointment date must be after today's date.")
-
-        return dt.strftime("%d-%m-%Y")
+        # Always interpret relative dates like 'tomorrow' in IST.
+        return _validate_future_date(v)
 
     @field_validator("time")
     @classmethod
@@ -317,21 +756,14 @@ class Appointment(BaseModel):
           - '15:30'
         Converts all formats to 'HH:MM AM/PM'.
         """
-        try:
-            parsed = parser.parse(v, fuzzy=True)
-        except Exception:
-            raise ValueError(
-                f"Invalid time format: {v}. Please provide a valid time like 9 AM or 10:30 AM."
-            )
-        return parsed.strftime("%I:%M %p")
+        return _validate_time(v)
 
     @field_validator("contact_phone")
     @classmethod
     def validate_phone(cls, v: str) -> str:
         if v is None:
             raise ValueError("Phone number is required.")
-        pattern = re.compile(r"^[6-9]\d{9}$")
-        if not pattern.match(v):
+        if not _PHONE_RE.fullmatch(v):
             raise ValueError(
                 "Invalid phone number format. Must be a 10-digit Indian mobile number starting with 6-9."
             )
@@ -346,47 +778,25 @@ class RescheduleRequest(BaseModel):
       - new_time
       - contact_email (used to locate existing appointment)
     """
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
     new_preferred_date: str = Field(..., description="New date in DD-MM-YYYY or natural language")
     new_time: str = Field(..., description="New time, flexible format")
-    contact_email: EmailStr = Field(..., description="Email used when booking the appointment")
+    contact_email: LookupEmail = Field(..., description="Email used when booking the appointment")
+    appointment_id: Optional[str] = Field(
+        None,
+        description="Appointment id if already known (e.g. from get_appointment_details); speeds up the lookup",
+    )
 
     @field_validator("new_preferred_date")
     @classmethod
     def validate_new_date(cls, v: str) -> str:
-        now = datetime.now(KOLKATA)
-        s = _normalize_input(v)
-
-        # Try natural resolver first
-        resolved = resolve_natural_date_phrase(s, now)
-        if resolved is not None:
-            if resolved.date() <= now.date():
-                raise ValueError("New appointment date must be after today's date.")
-            return resolved.strftime("%d-%m-%Y")
-
-        # Fallback to parser.parse
-        try:
-            dt = parser.parse(s, dayfirst=True, fuzzy=True)
-        except Exception as e:
-            raise ValueError(f"Could not parse date '{v}': {e}")
-
-        candidate = dt.replace(year=now.year)
-        if candidate.date() <= now.date():
-            candidate = candidate.replace(year=now.year + 1)
-        dt = candidate
-
-        if dt.date() <= now.date():
-            raise ValueError("New appointment date must be after today's date.")
-
-        return dt.strftime("%d-%m-%Y")
+        return _validate_future_date(v, label="New appointment")
 
     @field_validator("new_time")
     @classmethod
     def validate_new_time(cls, v: str) -> str:
-        try:
-            parsed = parser.parse(v, fuzzy=True)
-        except Exception:
-            raise ValueError(f"Invalid time format: {v}. Please provide a valid time like 9 AM or 4 PM.")
-        return parsed.strftime("%I:%M %p")
+        return _validate_time(v)
 
 
 class CancelRequest(BaseModel):
@@ -394,7 +804,9 @@ class CancelRequest(BaseModel):
     Data needed to cancel an existing appointment.
     For now, we cancel the nearest upcoming confirmed appointment for this email.
     """
-    contact_email: EmailStr = Field(..., description="Email used when booking the appointment")
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
+    contact_email: LookupEmail = Field(..., description="Email used when booking the appointment")
 
 
 class GetAppointmentRequest(BaseModel):
@@ -402,7 +814,9 @@ class GetAppointmentRequest(BaseModel):
     Data needed to look up an existing appointment.
     For now we return the nearest upcoming confirmed appointment for this email.
     """
-    contact_email: EmailStr = Field(..., description="Email used when booking the appointment")
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
+    contact_email: LookupEmail = Field(..., description="Email used when booking the appointment")
 
 
 class ModerationRequest(BaseModel):
@@ -410,13 +824,28 @@ class ModerationRequest(BaseModel):
     Used when the assistant detects inappropriate content.
     'reason' is a short description such as 'sexual content', 'harassment', etc.
     """
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
     reason: str = Field(..., description="Why the message is inappropriate (e.g. 'sexual content', 'harassment').")
 
 
 # ---------------------------------------------------------
-#  Global details for /appointment endpoint
+#  Last-booking details for the /appointment endpoint
 # ---------------------------------------------------------
-appointmentDetails: Dict[str, Any] = {}
+# Tools build a complete local dict and publish it with one reference
+# assignment (atomic in CPython), so concurrent requests never observe a
+# half-updated view and tool code no longer mutates shared state in place.
+_last_appointment_details: Dict[str, Any] = {}
+
+
+def get_last_appointment_details() -> Dict[str, Any]:
+    """Snapshot of the most recently booked/updated appointment."""
+    return _last_appointment_details
+
+
+def _publish_appointment_details(details: Dict[str, Any]) -> None:
+    global _last_appointment_details
+    _last_appointment_details = details
 
 
 # ---------------------------------------------------------
@@ -428,12 +857,17 @@ def parse_date_time(date_str: str, time_str: str) -> Tuple[datetime, datetime]:
     Used by both booking and rescheduling.
     """
     combined = f"{date_str} {time_str}"
-    dt = parser.parse(combined, dayfirst=True, fuzzy=True)
+
+    # Fast path: validators emit exactly DD-MM-YYYY + HH:MM AM/PM
+    dt = _strptime_any(combined, ("%d-%m-%Y %I:%M %p",))
+    if dt is None:
+        from dateutil import parser
+        dt = parser.parse(combined, parserinfo=_parser_info(), fuzzy=True)
 
     if dt.tzinfo is None:
         dt = dt.replace(tzinfo=KOLKATA)
     else:
-        dt = dt.astimezone(KOLKATA)
+        dt = _to_ist(dt)
 
     end_dt = dt + timedelta(minutes=30)
     return dt, end_dt
@@ -449,8 +883,6 @@ def _parse_appointment_to_datetimes(appointment: Appointment) -> Tuple[datetime,
 # ---------------------------------------------------------
 #  Agent setup
 # ---------------------------------------------------------
-load_dotenv()
-
 openrouter_provider = OpenAIProvider(
     base_url="https://openrouter.ai/api/v1",
     api_key=os.getenv("OPENROUTER_API_KEY"),
@@ -458,75 +890,90 @@ openrouter_provider = OpenAIProvider(
 
 model = OpenAIChatModel("kwaipilot/kat-coder-pro:free", provider=openrouter_provider)
 
-# System prompt: NOTE we now require the LLM to convert relative dates into DD-MM-YYYY before calling tools.
-sys_prompt = (
-    "You are a friendly, concise dental assistant. Ask only one piece of information at a time "
-    "(e.g., name → email → phone → date → time → service); NEVER list all questions at once. Keep replies short, "
-    "polite and natural. Do NOT assume any information.\n"
-    "When the user explicitly states a preference or personal detail (for example: “I prefer evening appointments”, “I like brief responses”, “I'm anxious about dental visits”),"
-    "you MUST populate the corresponding preference fields in the Appointment object (preferred_times, dental_anxiety, prefers_brief_responses, prefers_emojis, tone, etc.)"
-    "while continuing the current booking or scheduling flow. Do NOT pause the flow, do NOT ask for confirmation to store preferences, and do NOT mention memory or saving. Only store preferences that the user states explicitly."
-    "ALWAYS look for such preferences in every user message and update the Appointment object accordingly.\n"
-    f"Today is {TODAY_IST_VERBOSE} in Asia/Kolkata. "
-    "IMPORTANT: When the user gives a relative or natural-language date (e.g. 'today', 'tomorrow', "
-    "'day after tomorrow', 'in 3 days', 'next Monday', 'Monday'), you MUST convert it to an explicit "
-    "DD-MM-YYYY value (Asia/Kolkata) before calling any tool that accepts a date (preferred_date or new_preferred_date). "
-    f"Examples using today = {TODAY_IST_STR}: 'today' -> '{TODAY_IST_STR}'; 'tomorrow' -> (tomorrow's DD-MM-YYYY); "
-    "'day after tomorrow' -> (DD-MM-YYYY for +2 days). Always use the explicit DD-MM-YYYY string in tool call payloads and in user confirmations.\n\n"
-    "If the user wants to BOOK, call dental_booking_agent with collected details. If that tool returns "
-    "'unavailable' with alternatives, present those suggested slots and ask the user to pick one; do NOT "
-    "ask the user to invent new dates/times.\n"
-    "If the user asks about their preferences, call get_user_preferences using their email."
-    "If the user wants to RESCHEDULE, call reschedule_appointment using their email to find the booking.\n"
-    "Clinic hours (IST): 9:00-13:00 and 14:00-18:00. Do NOT suggest or book outside these hours or during "
-    "lunch (13:00-14:00). If asked for an outside time, explain the hours and offer valid times.\n"
-    "If the user wants to CANCEL, call cancel_appointment with their email. To VIEW/CHECK an appointment, call "
-    "get_appointment_details with their email.\n"
-    "Never claim an appointment is booked, rescheduled, cancelled, or retrieved unless the corresponding tool "
-    "returns success. If the user says 'yes', infer intent from context. Restrict to dental booking topics; "
-    "politely refuse unrelated requests. After successful booking/rescheduling, confirm with a summary.\n\n"
-    "After a booking is confirmed, if the user mentions a new preference (e.g., dental anxiety, tone, emoji usage, preferred dentist, preferred times), update preferences only using update_user_preferences."
-    "Do not check availability or modify the appointment unless the user explicitly asks to change the date or time."
-    "If a user message contains sexual content, harassment, abusive language, explicit or inappropriate statements, or "
-    "violent or hateful speech, you must not answer it or call any booking tools. Instead, call the `moderation_guard` tool "
-    "with a short reason (e.g., 'sexual content', 'harassment', 'violence'). Use only the message returned by that tool as your reply. "
-    "If the tool indicates that the conversation is ended due to repeated violations, you must not respond with anything "
-    "else and must repeat only that boundary message until the user returns to appropriate dental-booking questions.\n"
-    "If the user enters an invalid date, do not call the 'moderation_guard' tool; instead, politely inform them that the date is invalid and ask them to provide a valid date."
-    "RAG RULES:"
-    "- You may receive CONTEXT snippets from knowledge retrieval."
-    "- Clinic knowledge (prices, services, hours, doctors, insurance, policies, care instructions) is authoritative."
-    "- If clinic knowledge is present, use ONLY that. Never override it with general info."
-    "- General dental knowledge is educational only.\n\n"
-
-    "CONSTRAINTS:"
-    "- Answer ONLY using provided CONTEXT."
-    "- If the answer is not in CONTEXT, say you don’t have that information."
-    "- Never guess prices, durations, or clinic policies."
-    "- Do not diagnose or prescribe; advise seeing a dentist if needed.\n\n"
-
-    "BEHAVIOR:"
-    "- Do not mention retrieval, sources, or context."
-    "- Do not call booking tools for knowledge questions."
-    "- After clinic answers, you may offer to help book an appointment."
+# System prompt: compact bullets — prompt tokens are paid on every
+# single agent turn, so wording here is kept dense. The LLM must still
+# convert relative dates into DD-MM-YYYY before calling tools. Kept as
+# a template so 'today' is interpolated per turn instead of frozen at
+# import (a server running past midnight IST would otherwise anchor
+# relative dates to the wrong day).
+SYS_PROMPT_TEMPLATE = (
+    "You are a friendly, concise dental assistant. Ask for one detail at a time "
+    "(name → email → phone → date → time → service); never list all questions at once. "
+    "Keep replies short and natural; do not assume information.\n"
+    "Today is {today} (Asia/Kolkata). Convert any relative date ('today', "
+    "'tomorrow', 'in 3 days', 'next Monday') to an explicit DD-MM-YYYY string before "
+    "calling any tool that takes a date, and use it in confirmations.\n"
+    "Clinic hours (IST): 9:00-13:00 and 14:00-18:00. Never suggest or book outside "
+    "these hours or during lunch (13:00-14:00); explain the hours and offer valid times.\n"
+    "TOOLS (all lookups use the user's email): BOOK → dental_booking_agent; if it "
+    "returns 'unavailable' with alternatives, present those slots and ask the user to "
+    "pick — do not invent new times. RESCHEDULE → reschedule_appointment. CANCEL → "
+    "cancel_appointment. VIEW → get_appointment_details. Preference questions → "
+    "get_user_preferences.\n"
+    "When the user explicitly states a preference (e.g. evening slots, brief replies, "
+    "dental anxiety), set the matching Appointment fields (preferred_times, "
+    "dental_anxiety, prefers_brief_responses, prefers_emojis, tone) without pausing "
+    "the flow, asking to confirm, or mentioning memory. After a booking is confirmed, "
+    "newly mentioned preferences go through update_user_preferences only; do not "
+    "re-check availability or modify the appointment unless asked to change date/time.\n"
+    "Never claim a booking, reschedule, cancel, or lookup succeeded unless the tool "
+    "returned success. If the user says 'yes', infer intent from context. Stay on "
+    "dental-booking topics; politely refuse anything else. After success, confirm "
+    "with a short summary.\n"
+    "MODERATION: if a message is sexual, harassing, abusive, violent, or hateful, do "
+    "not answer or call booking tools — call moderation_guard with a short reason and "
+    "reply only with its returned message (repeat it while the conversation is ended). "
+    "An invalid date is not a violation; just ask for a valid date.\n"
+    "RAG: you may receive CONTEXT snippets. Clinic knowledge is authoritative — never "
+    "override it with general info, which is educational only. Answer knowledge "
+    "questions only from CONTEXT; if the answer is not there, say you don't have that "
+    "information. Never guess prices, durations, or policies; do not diagnose or "
+    "prescribe. Do not mention retrieval or call booking tools for knowledge "
+    "questions; after clinic answers you may offer to book."
 )
 
+
+@functools.lru_cache(maxsize=2)
+def _sys_prompt_for_day(today_str: str) -> str:
+    # Formatted once per IST date; the lru_cache key rotates naturally
+    # at midnight when today_str changes.
+    return SYS_PROMPT_TEMPLATE.format(today=today_str)
+
+
+def get_system_prompt() -> str:
+    """Current system prompt with today's IST date interpolated."""
+    return _sys_prompt_for_day(_fmt_date(datetime.now(KOLKATA)))
+
+
 agent = Agent(
     model=model,
-    system_prompt=sys_prompt,
+    deps_type=SessionDeps,
     retries=3,
 )
 
-# Before optimization
-old_prompt_tokens = count_tokens(sys_prompt)
-print(f"Current token usage is: {old_prompt_tokens} tokens per request")
+
+@agent.system_prompt(dynamic=True)
+def _dynamic_system_prompt() -> str:
+    return get_system_prompt()
+
+
+@functools.lru_cache(maxsize=1)
+def sys_prompt_tokens() -> int:
+    """System-prompt token count, computed on first use only."""
+    return count_tokens(get_system_prompt())
+
+
+# Tokenizing at import loads the full BPE table in every worker just to
+# print one number; only pay that when explicitly debugging.
+if os.getenv("DEBUG_TOKENS"):
+    print(f"Current token usage is: {sys_prompt_tokens()} tokens per request")
 
 
 # ---------------------------------------------------------
 #  Tool: moderation_guard
 # ---------------------------------------------------------
 @agent.tool
-def moderation_guard(ctx: RunContext[None], req: ModerationRequest) -> dict:
+def moderation_guard(ctx: RunContext[SessionDeps], req: ModerationRequest) -> dict:
     """
     Called by the LLM whenever it detects inappropriate content in the user's message.
 
@@ -536,8 +983,10 @@ def moderation_guard(ctx: RunContext[None], req: ModerationRequest) -> dict:
       - Signals when the conversation should effectively be "ended".
     """
     print(">>> TOOL CALLED: moderation_guard")
-    _violation_state["count"] += 1
-    count = _violation_state["count"]
+    # Defensive for ad-hoc runs without deps (scripts, smoke tests)
+    deps = ctx.deps if ctx.deps is not None else SessionDeps()
+    deps.violations += 1
+    count = deps.violations
 
     if count == 1:
         message = (
@@ -582,7 +1031,7 @@ def moderation_guard(ctx: RunContext[None], req: ModerationRequest) -> dict:
 #  Tool: Book appointment (Pinecone + Google Calendar)
 # ---------------------------------------------------------
 @agent.tool
-def dental_booking_agent(ctx: RunContext[None], appointment: Appointment) -> dict:
+def dental_booking_agent(ctx: RunContext[SessionDeps], appointment: Appointment) -> dict:
     """
     Books a dental appointment and returns a structured confirmation.
 
@@ -622,69 +1071,78 @@ def dental_booking_agent(ctx: RunContext[None], appointment: Appointment) -> dic
         else:
             user_id = f"user:{patient_name}:{appointment.contact_phone}"
 
-        # 2) Check Google Calendar slot
-        if not is_slot_free(start_dt, end_dt):
-            # Find nearby alternative slots
-            alternatives = find_alternative_slots(start_dt, duration_minutes=30, max_suggestions=4)
-
-            if alternatives:
-                lines = []
-                alt_structs = []
-
-                for alt_start, alt_end in alternatives:
-                    alt_local = alt_start.astimezone(KOLKATA)
-                    date_display = alt_local.strftime("%d-%m-%Y")
-                    time_display = alt_local.strftime("%I:%M %p")
-
-                    lines.append(f"* {date_display} — {time_display}")
-                    alt_structs.append(
-                        {
-                            "start_time": alt_start.isoformat(),
-                            "end_time": alt_end.isoformat(),
-                            "date_display": date_display,
-                            "time_display": time_display,
-                        }
+        # 2–4) Check availability, create the calendar event and mark the
+        # slot booked under a per-slot lock, so two concurrent requests
+        # for the same time can't both pass the free check.
+        with _slot_lock(start_dt, end_dt):
+            # 2) Check Google Calendar slot and fetch alternatives in one
+            # round trip (short-TTL cached)
+            slot_free, alternatives = _check_slot_cached(start_dt, end_dt)
+            if not slot_free:
+                if alternatives:
+                    lines = []
+                    alt_structs = []
+
+                    for alt_start, alt_end in alternatives:
+                        alt_local = _to_ist(alt_start)
+                        date_display = _fmt_date(alt_local)
+                        time_display = _fmt_time(alt_local)
+
+                        lines.append(f"* {date_display} — {time_display}")
+                        alt_structs.append(
+                            {
+                                "start_time": alt_start.isoformat(),
+                                "end_time": alt_end.isoformat(),
+                                "date_display": date_display,
+                                "time_display": time_display,
+                            }
+                        )
+
+                    msg = (
+                        f"❌ Sorry {patient_name}, that time slot on {appointment.preferred_date} "
+                        f"at {appointment.time} is already booked.\n\n"
+                        "Here are the closest available times:\n"
+                        + "\n".join(lines)
+                        + "\n\nWhich one would you like to book?"
                     )
 
+                    # The LLM will see this message and should ask the user to pick one
+                    return {
+                        "status": "unavailable",
+                        "message": msg,
+                        "alternatives": alt_structs,
+                    }
+
+                # Fallback: no alternatives found
                 msg = (
                     f"❌ Sorry {patient_name}, that time slot on {appointment.preferred_date} "
-                    f"at {appointment.time} is already booked.\n\n"
-                    "Here are the closest available times:\n"
-                    + "\n".join(lines)
-                    + "\n\nWhich one would you like to book?"
+                    f"at {appointment.time} is already booked, and I couldn't find any nearby free slots. "
+                    "Would you like to try a different date?"
                 )
+                return {"status": "unavailable", "message": msg}
 
-                # The LLM will see this message and should ask the user to pick one
-                return {
-                    "status": "unavailable",
-                    "message": msg,
-                    "alternatives": alt_structs,
-                }
-
-            # Fallback: no alternatives found
-            msg = (
-                f"❌ Sorry {patient_name}, that time slot on {appointment.preferred_date} "
-                f"at {appointment.time} is already booked, and I couldn't find any nearby free slots. "
-                "Would you like to try a different date?"
+            # 3) Create StoredAppointment for persistence
+            stored = StoredAppointment(
+                # .hex skips uuid4's hyphenated formatting pass; ids are
+                # opaque Pinecone/calendar keys, so the form doesn't matter
+                id=uuid.uuid4().hex,
+                user_id=user_id,
+                patient_name=patient_name,
+                reason=reason,
+                start_time=start_dt,
+                end_time=end_dt,
+                status="confirmed",
             )
-            return {"status": "unavailable", "message": msg}
-
-        # 3) Create StoredAppointment for persistence
-        stored = StoredAppointment(
-            id=str(uuid.uuid4()),
-            user_id=user_id,
-            patient_name=patient_name,
-            reason=reason,
-            start_time=start_dt,
-            end_time=end_dt,
-            status="confirmed",
-        )
 
-        # 4) Create event in Google Calendar
-        event_id = create_calendar_event(stored)
-        stored.google_event_id = event_id
+            # 4) Create event in Google Calendar
+            event_id = create_calendar_event(stored)
+            stored.google_event_id = event_id
+            _mark_slot_booked(start_dt, end_dt)
 
-        # 5) Save user profile if we have email
+        # 5+6) Queue user-profile and appointment writes to Pinecone.
+        # The calendar event (authoritative) already exists, so these
+        # writes happen behind the response via the write-behind worker
+        # and the user sees the confirmation a Pinecone round-trip sooner.
         if appointment.contact_email:
             profile = UserProfile(
                 user_id=user_id,
@@ -692,35 +1150,36 @@ def dental_booking_agent(ctx: RunContext[None], appointment: Appointment) -> dic
                 email=appointment.contact_email,
                 phone=appointment.contact_phone,
             )
-            save_user(profile,
-                    preferences={
-                        "preferred_times": appointment.preferred_times,
-                        "preferred_dentist": appointment.preferred_dentist,
-                        "insurance_provider": appointment.insurance_provider,
-                        "dental_anxiety": appointment.dental_anxiety,
-                        "prefers_brief_responses": appointment.prefers_brief_responses,
-                        "prefers_emojis": appointment.prefers_emojis,
-                        "tone": appointment.tone,
-                        "last_updated": appointment.last_updated.isoformat(),
-    })
-
-        # 6) Save appointment to Pinecone
-        save_stored_appointment(stored)
-
-        # 7) Update in-memory details
-        global appointmentDetails
-        appointmentDetails["name"] = appointment.name
-        appointmentDetails["date"] = appointment.preferred_date
-        appointmentDetails["time"] = appointment.time
-        appointmentDetails["reason"] = appointment.reason
-        appointmentDetails["phone"] = appointment.contact_phone
-        appointmentDetails["email"] = appointment.contact_email
-        appointmentDetails["start_time"] = start_dt.isoformat()
-        appointmentDetails["end_time"] = end_dt.isoformat()
-        appointmentDetails["google_event_id"] = event_id
-        appointmentDetails["user_id"] = user_id
-
-        local_time_str = start_dt.strftime("%d-%m-%Y at %I:%M %p")
+            preferences = {
+                "preferred_times": appointment.preferred_times,
+                "preferred_dentist": appointment.preferred_dentist,
+                "insurance_provider": appointment.insurance_provider,
+                "dental_anxiety": appointment.dental_anxiety,
+                "prefers_brief_responses": appointment.prefers_brief_responses,
+                "prefers_emojis": appointment.prefers_emojis,
+                "tone": appointment.tone,
+                "last_updated": appointment.last_updated.isoformat(),
+            }
+            # Coalesced write: profile + appointment go out together
+            _write_queue.put((save_user_and_appointment, (profile, preferences, stored)))
+        else:
+            _write_queue.put((save_stored_appointment, (stored,)))
+
+        # 7) Publish in-memory details for /appointment
+        _publish_appointment_details({
+            "name": appointment.name,
+            "date": appointment.preferred_date,
+            "time": appointment.time,
+            "reason": appointment.reason,
+            "phone": appointment.contact_phone,
+            "email": appointment.contact_email,
+            "start_time": start_dt.isoformat(),
+            "end_time": end_dt.isoformat(),
+            "google_event_id": event_id,
+            "user_id": user_id,
+        })
+
+        local_time_str = _fmt_when(start_dt)
         confirmation = (
             "✅ Appointment booked!\n"
             f"Name: {appointment.name}\n"
@@ -745,7 +1204,7 @@ def dental_booking_agent(ctx: RunContext[None], appointment: Appointment) -> dic
 #  Tool: Reschedule appointment
 # ---------------------------------------------------------
 @agent.tool
-def reschedule_appointment(ctx: RunContext[None], req: RescheduleRequest) -> dict:
+def reschedule_appointment(ctx: RunContext[SessionDeps], req: RescheduleRequest) -> dict:
     """
     Reschedules the user's latest upcoming confirmed appointment to a new date/time.
     """
@@ -753,8 +1212,30 @@ def reschedule_appointment(ctx: RunContext[None], req: RescheduleRequest) -> dic
     try:
         user_id = req.contact_email
 
-        # 1) Find existing appointment for this user
-        existing = get_latest_confirmed_future_appointment(user_id)
+        # 1) Kick off the Pinecone lookup so its round trip overlaps the
+        # parsing/validation below. When the LLM already knows the
+        # appointment id, a keyed fetch replaces the top_k metadata scan.
+        if req.appointment_id:
+            existing_future = _io_pool.submit(
+                get_appointment_by_id, req.appointment_id
+            )
+        else:
+            existing_future = _io_pool.submit(
+                get_latest_confirmed_future_appointment, user_id
+            )
+
+        # 2) Parse new datetimes directly
+        new_start, new_end = parse_date_time(req.new_preferred_date, req.new_time)
+
+        existing = existing_future.result()
+        if req.appointment_id and (
+            existing is None
+            or existing.status != "confirmed"
+            or existing.user_id != user_id
+        ):
+            # Stale or mismatched id from the LLM — fall back to the
+            # authoritative per-user lookup rather than trusting it
+            existing = get_latest_confirmed_future_appointment(user_id)
         if not existing:
             return {
                 "status": "not_found",
@@ -764,8 +1245,6 @@ def reschedule_appointment(ctx: RunContext[None], req: RescheduleRequest) -> dic
                 ),
             }
 
-        # 2) Parse new datetimes directly
-        new_start, new_end = parse_date_time(req.new_preferred_date, req.new_time)
         old_start = existing.start_time
 
         # 2.5) Enforce clinic working hours for reschedule
@@ -794,22 +1273,28 @@ def reschedule_appointment(ctx: RunContext[None], req: RescheduleRequest) -> dic
             existing.google_event_id = event_id
 
         # 5) Save updated appointment back to Pinecone (upsert on same id)
-        save_stored_appointment(existing)
-
-        # 6) Update in-memory appointmentDetails
-        global appointmentDetails
-        appointmentDetails["name"] = existing.patient_name
-        appointmentDetails["date"] = existing.start_time.strftime("%d-%m-%Y")
-        appointmentDetails["time"] = existing.start_time.strftime("%I:%M %p")
-        appointmentDetails["reason"] = existing.reason
-        appointmentDetails["email"] = user_id
-        appointmentDetails["start_time"] = existing.start_time.isoformat()
-        appointmentDetails["end_time"] = existing.end_time.isoformat()
-        appointmentDetails["google_event_id"] = existing.google_event_id
-        appointmentDetails["user_id"] = user_id
-
-        old_str = old_start.strftime("%d-%m-%Y at %I:%M %p")
-        new_str = new_start.strftime("%d-%m-%Y at %I:%M %p")
+        # via the write-behind queue; the moved calendar event is already
+        # authoritative.
+        _write_queue.put((save_stored_appointment, (existing,)))
+
+        # Format each timestamp once and reuse the strings below
+        new_date_str = _fmt_date(new_start)
+        new_time_str = _fmt_time(new_start)
+        old_str = _fmt_when(old_start)
+        new_str = f"{new_date_str} at {new_time_str}"
+
+        # 6) Publish in-memory details for /appointment
+        _publish_appointment_details({
+            "name": existing.patient_name,
+            "date": new_date_str,
+            "time": new_time_str,
+            "reason": existing.reason,
+            "email": user_id,
+            "start_time": new_start.isoformat(),
+            "end_time": new_end.isoformat(),
+            "google_event_id": existing.google_event_id,
+            "user_id": user_id,
+        })
 
         message = (
             "✅ Your appointment has been rescheduled.\n"
@@ -832,7 +1317,7 @@ def reschedule_appointment(ctx: RunContext[None], req: RescheduleRequest) -> dic
 #  Tool: Cancel appointment
 # ---------------------------------------------------------
 @agent.tool
-def cancel_appointment(ctx: RunContext[None], req: CancelRequest) -> dict:
+def cancel_appointment(ctx: RunContext[SessionDeps], req: CancelRequest) -> dict:
     """
     Cancels the user's nearest upcoming confirmed appointment.
     """
@@ -851,27 +1336,36 @@ def cancel_appointment(ctx: RunContext[None], req: CancelRequest) -> dict:
                 ),
             }
 
-        # 2) Cancel the calendar event (soft-fail if it errors)
-        cancel_calendar_event(existing)
-
-        # 3) Mark as cancelled in persistence
+        # 2+3) Cancel the calendar event and mark the record cancelled in
+        # persistence. The two calls hit different services and neither
+        # depends on the other's response (cancel_calendar_event already
+        # soft-fails internally), so run them concurrently: wall time is
+        # max(calendar, pinecone) instead of their sum.
         existing.status = "cancelled"
+        cancel_future = _io_pool.submit(cancel_calendar_event, existing)
         save_stored_appointment(existing)
-
-        # 4) Update in-memory appointmentDetails
-        global appointmentDetails
-        appointmentDetails["name"] = existing.patient_name
-        appointmentDetails["date"] = existing.start_time.strftime("%d-%m-%Y")
-        appointmentDetails["time"] = existing.start_time.strftime("%I:%M %p")
-        appointmentDetails["reason"] = existing.reason
-        appointmentDetails["email"] = user_id
-        appointmentDetails["start_time"] = existing.start_time.isoformat()
-        appointmentDetails["end_time"] = existing.end_time.isoformat()
-        appointmentDetails["google_event_id"] = existing.google_event_id
-        appointmentDetails["user_id"] = user_id
-        appointmentDetails["status"] = "cancelled"
-
-        when_str = existing.start_time.strftime("%d-%m-%Y at %I:%M %p")
+        cancel_future.result()
+
+        # Read start_time once and format each timestamp once; the
+        # strings below all reuse these locals
+        start = existing.start_time
+        date_str = _fmt_date(start)
+        time_str = _fmt_time(start)
+        when_str = f"{date_str} at {time_str}"
+
+        # 4) Publish in-memory details for /appointment
+        _publish_appointment_details({
+            "name": existing.patient_name,
+            "date": date_str,
+            "time": time_str,
+            "reason": existing.reason,
+            "email": user_id,
+            "start_time": start.isoformat(),
+            "end_time": existing.end_time.isoformat(),
+            "google_event_id": existing.google_event_id,
+            "user_id": user_id,
+            "status": "cancelled",
+        })
         message = (
             "✅ Your appointment has been cancelled.\n"
             f"Cancelled appointment was scheduled for {when_str}.\n"
@@ -892,7 +1386,7 @@ def cancel_appointment(ctx: RunContext[None], req: CancelRequest) -> dict:
 #  Tool: Get appointment details
 # ---------------------------------------------------------
 @agent.tool
-def get_appointment_details(ctx: RunContext[None], req: GetAppointmentRequest) -> dict:
+def get_appointment_details(ctx: RunContext[SessionDeps], req: GetAppointmentRequest) -> dict:
     """
     Returns the nearest upcoming confirmed appointment for this email, if any.
     """
@@ -910,9 +1404,15 @@ def get_appointment_details(ctx: RunContext[None], req: GetAppointmentRequest) -
                 ),
             }
 
-        # Build a clean, serializable representation
-        start_local = existing.start_time.astimezone(KOLKATA)
-        end_local = existing.end_time.astimezone(KOLKATA)
+        # Build a clean, serializable representation. Format each
+        # timestamp once into locals; the result dict, the published
+        # details and the summary below all reuse the same strings.
+        start_local = _to_ist(existing.start_time)
+        end_local = _to_ist(existing.end_time)
+        start_iso = start_local.isoformat()
+        end_iso = end_local.isoformat()
+        date_display = _fmt_date(start_local)
+        time_display = _fmt_time(start_local)
 
         result = {
             "status": "found",
@@ -920,33 +1420,34 @@ def get_appointment_details(ctx: RunContext[None], req: GetAppointmentRequest) -
             "patient_name": existing.patient_name,
             "reason": existing.reason,
             "status_value": existing.status,
-            "start_time": start_local.isoformat(),
-            "end_time": end_local.isoformat(),
-            "date_display": start_local.strftime("%d-%m-%Y"),
-            "time_display": start_local.strftime("%I:%M %p"),
+            "start_time": start_iso,
+            "end_time": end_iso,
+            "date_display": date_display,
+            "time_display": time_display,
             "google_event_id": existing.google_event_id,
             "user_id": existing.user_id,
         }
 
-        # Optionally also update in-memory appointmentDetails so /appointment reflects this
-        global appointmentDetails
-        appointmentDetails["name"] = existing.patient_name
-        appointmentDetails["date"] = result["date_display"]
-        appointmentDetails["time"] = result["time_display"]
-        appointmentDetails["reason"] = existing.reason
-        appointmentDetails["email"] = user_id
-        appointmentDetails["start_time"] = result["start_time"]
-        appointmentDetails["end_time"] = result["end_time"]
-        appointmentDetails["google_event_id"] = existing.google_event_id
-        appointmentDetails["user_id"] = existing.user_id
-        appointmentDetails["status"] = existing.status
+        # Optionally also publish in-memory details so /appointment reflects this
+        _publish_appointment_details({
+            "name": existing.patient_name,
+            "date": date_display,
+            "time": time_display,
+            "reason": existing.reason,
+            "email": user_id,
+            "start_time": start_iso,
+            "end_time": end_iso,
+            "google_event_id": existing.google_event_id,
+            "user_id": existing.user_id,
+            "status": existing.status,
+        })
 
         # Human-friendly summary the LLM can echo
         summary = (
             "Here are your upcoming appointment details:\n"
             f"- Name: {existing.patient_name}\n"
-            f"- Date: {result['date_display']}\n"
-            f"- Time: {result['time_display']}\n"
+            f"- Date: {date_display}\n"
+            f"- Time: {time_display}\n"
             f"- Reason: {existing.reason}\n"
             f"- Status: {existing.status}"
         )
@@ -973,7 +1474,7 @@ def check_appointment_slot_available(appointment: Appointment) -> str:
     """
     try:
         start_dt, end_dt = _parse_appointment_to_datetimes(appointment)
-        if is_slot_free(start_dt, end_dt):
+        if _is_slot_free_cached(start_dt, end_dt):
             return (
                 f"The requested time slot on {appointment.preferred_date} at {appointment.time} "
                 "is available for booking."
@@ -988,8 +1489,22 @@ def check_appointment_slot_available(appointment: Appointment) -> str:
     
 
 
+def _upsert_user_metadata(email: str, metadata: Dict[str, Any]) -> None:
+    index.upsert(
+        vectors=[
+            {
+                "id": f"user-{email}",
+                "values": DUMMY_VECTOR,
+                "metadata": metadata,
+            }
+        ],
+        namespace="users",
+    )
+    invalidate_user_cache(email)
+
+
 @agent.tool
-def update_user_preferences(ctx: RunContext[None], profile: dict) -> dict:
+def update_user_preferences(ctx: RunContext[SessionDeps], profile: dict) -> dict:
     """
     Update existing user preference fields only.
     LLM should provide:
@@ -1018,29 +1533,22 @@ def update_user_preferences(ctx: RunContext[None], profile: dict) -> dict:
             if k not in ("contact_email", "type", "user_id") and v is not None
         }
 
-        existing.update(updated_prefs)
-
-        
-        # Remove fields like "None" → treat as null
-        for k in list(existing.keys()):
-            if isinstance(existing[k], str) and existing[k].strip().lower() == "none":
-                del existing[k]
-
-        cleaned = _clean_metadata(existing)
+        # One fused pass: merge, drop nulls/empties (what _clean_metadata
+        # does), and drop "None" strings — instead of merge + delete loop
+        # + a third _clean_metadata walk over the same dict.
+        cleaned = {
+            k: v
+            for k, v in {**existing, **updated_prefs}.items()
+            if v is not None
+            and v != []
+            and not (isinstance(v, str) and v.strip().lower() == "none")
+        }
         print(">>> UPSERT DATA:", cleaned)
 
-        index.upsert(
-        vectors=[
-            {
-                "id": f"user-{email}",
-                "values": DUMMY_VECTOR,
-                "metadata": cleaned,
-            }
-        ],
-        namespace="users",
-    )
-
-
+        # The merged metadata is complete at this point, so the upsert
+        # round trip doesn't need to block the tool's reply — hand it to
+        # the write-behind worker like the other persistence writes.
+        _write_queue.put((_upsert_user_metadata, (email, cleaned)))
 
         print(">>> User preferences updated:", updated_prefs)
 
@@ -1057,15 +1565,12 @@ def update_user_preferences(ctx: RunContext[None], profile: dict) -> dict:
         }
 
 
-from pydantic import BaseModel, EmailStr
-
-
 class GetPreferencesRequest(BaseModel):
-    contact_email: EmailStr
+    contact_email: LookupEmail
 
 
 @agent.tool
-def get_user_preferences(ctx: RunContext[None], req: GetPreferencesRequest) -> dict:
+def get_user_preferences(ctx: RunContext[SessionDeps], req: GetPreferencesRequest) -> dict:
     """
     Returns stored user preference fields for the email provided.
     """
@@ -1126,13 +1631,16 @@ def get_user_preferences(ctx: RunContext[None], req: GetPreferencesRequest) -> d
 # ---------------------------------------------------------
 if __name__ == "__main__":
     print(" hey, how can I help you? ")
-    exit_conditions = (":q", "quit", "exit", "bye")
+    # frozenset: O(1) membership, and normalizing the input first means
+    # "Quit" / " exit " also end the session.
+    exit_conditions = frozenset({":q", "quit", "exit", "bye"})
 
     msg_history: list[dict[str, Any]] = []
+    session_deps = SessionDeps()
 
     while True:
         query = input("> ")
-        if query in exit_conditions:
+        if query.strip().lower() in exit_conditions:
             break
         else:
             rag_context = retrieve_rag_context(query)
@@ -1147,9 +1655,11 @@ if __name__ == "__main__":
                     f"{query}"
                 )
 
-            result = agent.run_sync(query, message_history=msg_history)
+            result = agent.run_sync(query, message_history=msg_history, deps=session_deps)
 
-            msg_history = result.all_messages()
+            # Append only this turn's messages; all_messages() copies the
+            # entire history each turn (quadratic over a long session).
+            msg_history.extend(result.new_messages())
             print(result.output)
 
     print(" Bye ")
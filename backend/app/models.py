@@ -1,7 +1,7 @@
 # backend/app/models.py
 
 from pydantic import BaseModel, EmailStr, Field
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import List, Optional
 
 
@@ -19,8 +19,13 @@ class UserPreferences(BaseModel):
     prefers_emojis: Optional[bool] = None
     tone: Optional[str] = None  # 'formal' | 'friendly'
 
-    # Helps enforce memory update logic
-    last_updated: Optional[str] = Field(default_factory=lambda: datetime.utcnow().isoformat())
+    # Helps enforce memory update logic. Aware UTC now: utcnow() is
+    # deprecated and returns a naive datetime. Stays a string because
+    # this value goes straight into Pinecone metadata, which only takes
+    # strings/numbers/bools.
+    last_updated: Optional[str] = Field(
+        default_factory=lambda: datetime.now(timezone.utc).isoformat()
+    )
 
 
 class UserProfile(BaseModel):
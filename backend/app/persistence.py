@@ -2,15 +2,71 @@
 
 from __future__ import annotations
 
+import functools
+import time
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Dict
 
-from .pinecone_client import index
+from .pinecone_client import index, wait_for_upsert
 from .models import UserProfile, StoredAppointment
 
+# -------------------------------
+# Short-lived lookup cache
+# -------------------------------
+# Several tools re-fetch the same user/appointment records for one email
+# within a single agent turn; cache reads so repeats hit memory instead
+# of Pinecone. Writes invalidate their user's entries, and /chat clears
+# the cache after each turn so requests always start fresh.
+#
+# Entries also carry a TTL: the GET /appointments endpoints never run
+# the per-turn clear, so a polling client would otherwise be served the
+# same entry forever if no in-process write happened to invalidate it.
+# Within the TTL repeated polls are memory hits; past it they refresh.
+
+_LOOKUP_TTL_SECONDS = 60.0
+
+# key -> (value, expires_at)
+_lookup_cache: Dict[str, tuple] = {}
+
+# Sentinel distinguishing "not cached" from a cached None/miss
+_CACHE_MISS = object()
+
+
+def _cache_get(key: str):
+    entry = _lookup_cache.get(key)
+    if entry is not None:
+        value, expires_at = entry
+        if time.time() < expires_at:
+            return value
+        del _lookup_cache[key]
+    return _CACHE_MISS
+
+
+def _cache_put(key: str, value) -> None:
+    _lookup_cache[key] = (value, time.time() + _LOOKUP_TTL_SECONDS)
+
+
+def clear_lookup_cache() -> None:
+    """Drop all cached lookups. Called after each agent turn."""
+    _lookup_cache.clear()
+
+
+def invalidate_user_cache(user_id: str) -> None:
+    """Drop cached lookups for one user after a write on their records."""
+    prefix_user = f"user:{user_id}"
+    prefix_appts = f"appts:{user_id}:"
+    for key in [k for k in _lookup_cache if k == prefix_user or k.startswith(prefix_appts)]:
+        del _lookup_cache[key]
+
+
 # Helper to retrieve the current stored metadata for a specific user
 
 def get_user_metadata(user_id: str) -> Optional[Dict]:
+    cache_key = f"user:{user_id}"
+    cached = _cache_get(cache_key)
+    if cached is not _CACHE_MISS:
+        return cached
+
     result = index.query(
         namespace="users",
         vector=DUMMY_VECTOR,
@@ -21,10 +77,10 @@ def get_user_metadata(user_id: str) -> Optional[Dict]:
     )
 
     matches = result.get("matches")
-    if not matches:
-        return None
+    metadata = matches[0].metadata if matches else None
 
-    return matches[0].metadata
+    _cache_put(cache_key, metadata)
+    return metadata
 
 
 # -------------------------------
@@ -35,6 +91,10 @@ def _clean_metadata(md: Dict) -> Dict:
     """
     Pinecone does not allow null values.
     Remove keys where value is None or empty.
+
+    Used for the user metadata, whose preference keys are dynamic. The
+    appointment schema is fixed, so _appointment_metadata strips its one
+    nullable key directly instead of paying this full-dict walk.
     """
     return {
         k: v
@@ -45,18 +105,19 @@ def _clean_metadata(md: Dict) -> Dict:
 
 IST = timezone(timedelta(hours=5, minutes=30))
 
-# Keep this consistent with your index dimension
+# Keep this consistent with your index dimension.
+# Built once at import and frozen: every query/upsert shares this one
+# object instead of risking per-call copies or accidental mutation.
 DUMMY_VECTOR_DIM = 64
 
-DUMMY_VECTOR = [0.0] * DUMMY_VECTOR_DIM
-DUMMY_VECTOR[0] = 1.0
+DUMMY_VECTOR = (1.0,) + (0.0,) * (DUMMY_VECTOR_DIM - 1)
 
 
 # -------------------------------------------------
 #  USER PROFILE + PREFERENCES
 # -------------------------------------------------
 
-def save_user(user: UserProfile, preferences: Optional[Dict] = None) -> None:
+def _user_metadata(user: UserProfile, preferences: Optional[Dict] = None) -> Dict:
     # Get existing metadata
     existing_md = get_user_metadata(user.user_id) or {}
 
@@ -75,16 +136,19 @@ def save_user(user: UserProfile, preferences: Optional[Dict] = None) -> None:
             if value is not None:
                 existing_md[key] = value
 
-    cleaned = _clean_metadata(existing_md)
+    return _clean_metadata(existing_md)
+
 
+def save_user(user: UserProfile, preferences: Optional[Dict] = None) -> None:
     index.upsert(
         vectors=[(
             f"user-{user.user_id}",
             DUMMY_VECTOR,
-            cleaned,
+            _user_metadata(user, preferences),
         )],
         namespace="users",
     )
+    invalidate_user_cache(user.user_id)
 
 
 
@@ -92,14 +156,11 @@ def save_user(user: UserProfile, preferences: Optional[Dict] = None) -> None:
 #  APPOINTMENTS
 # -------------------------------------------------
 
-def save_stored_appointment(appt: StoredAppointment) -> None:
-    """
-    Store StoredAppointment in Pinecone under namespace 'appointments'.
-    """
+def _appointment_metadata(appt: StoredAppointment) -> Dict:
     if not appt.id:
         raise ValueError("StoredAppointment.id must be set before saving")
 
-    metadata = _clean_metadata({
+    md = {
         "type": "appointment",
         "id": appt.id,
         "user_id": appt.user_id,
@@ -109,18 +170,75 @@ def save_stored_appointment(appt: StoredAppointment) -> None:
         "end_time": appt.end_time.isoformat(),
         "google_event_id": appt.google_event_id,
         "status": appt.status,
-    })
+    }
+
+    # Only google_event_id can legitimately be null in this fixed schema
+    if md["google_event_id"] is None:
+        del md["google_event_id"]
+
+    return md
+
 
+def save_stored_appointment(appt: StoredAppointment) -> None:
+    """
+    Store StoredAppointment in Pinecone under namespace 'appointments'.
+    """
     index.upsert(
         vectors=[
             (
                 f"appt-{appt.id}",
                 DUMMY_VECTOR,
-                metadata,
+                _appointment_metadata(appt),
             )
         ],
         namespace="appointments",
     )
+    invalidate_user_cache(appt.user_id)
+    _lookup_cache.pop(f"appt-id:{appt.id}", None)
+
+
+def save_user_and_appointment(
+    user: UserProfile,
+    preferences: Optional[Dict],
+    appt: StoredAppointment,
+) -> None:
+    """
+    Persist the user profile and their appointment together (the booking
+    path always writes both). The vectors live in different namespaces,
+    so they can't share one upsert call; issuing both with async_req
+    overlaps them into roughly one round trip of wall time instead of two.
+    """
+    user_md = _user_metadata(user, preferences)
+    appt_md = _appointment_metadata(appt)
+
+    async_results = [
+        index.upsert(
+            vectors=[(f"user-{user.user_id}", DUMMY_VECTOR, user_md)],
+            namespace="users",
+            async_req=True,
+        ),
+        index.upsert(
+            vectors=[(f"appt-{appt.id}", DUMMY_VECTOR, appt_md)],
+            namespace="appointments",
+            async_req=True,
+        ),
+    ]
+
+    for result in async_results:
+        wait_for_upsert(result)
+
+    invalidate_user_cache(user.user_id)
+    invalidate_user_cache(appt.user_id)
+    _lookup_cache.pop(f"appt-id:{appt.id}", None)
+
+
+# Hydrating a top_k=50 result parses up to 100 ISO strings, but the
+# strings cluster on the clinic's half-hour slot grid, so the same
+# timestamps recur constantly — cache the decode. datetimes are
+# immutable, so sharing one object across models is safe.
+@functools.lru_cache(maxsize=2048)
+def _parse_iso(s: str) -> datetime:
+    return datetime.fromisoformat(s)
 
 
 def _stored_appointment_from_metadata(md: dict) -> StoredAppointment:
@@ -129,22 +247,58 @@ def _stored_appointment_from_metadata(md: dict) -> StoredAppointment:
         user_id=md["user_id"],
         patient_name=md.get("patient_name", ""),
         reason=md.get("reason", ""),
-        start_time=datetime.fromisoformat(md["start_time"]),
-        end_time=datetime.fromisoformat(md["end_time"]),
+        start_time=_parse_iso(md["start_time"]),
+        end_time=_parse_iso(md["end_time"]),
         google_event_id=md.get("google_event_id"),
         status=md.get("status", "confirmed"),
     )
 
 
+def get_appointment_by_id(appointment_id: str) -> Optional[StoredAppointment]:
+    """
+    Keyed fetch of a single appointment record. Cheaper than the top_k
+    metadata query when the caller already knows the id (e.g. the LLM is
+    rescheduling an appointment it just looked up).
+    """
+    cache_key = f"appt-id:{appointment_id}"
+    cached = _cache_get(cache_key)
+    if cached is not _CACHE_MISS:
+        return cached
+
+    result = index.fetch(
+        ids=[f"appt-{appointment_id}"],
+        namespace="appointments",
+    )
+    record = (result.vectors or {}).get(f"appt-{appointment_id}")
+    md = getattr(record, "metadata", None) if record else None
+    appointment = _stored_appointment_from_metadata(md) if md else None
+
+    _cache_put(cache_key, appointment)
+    return appointment
+
+
 def get_appointments_for_user(
     user_id: str,
-    limit: int = 50
+    limit: int = 50,
+    status: Optional[str] = None,
 ) -> List[StoredAppointment]:
+    cache_key = f"appts:{user_id}:{limit}:{status}"
+    cached = _cache_get(cache_key)
+    if cached is not _CACHE_MISS:
+        return cached
+
+    # Filter server-side where Pinecone supports it (string equality);
+    # the time bound stays client-side because start_time is stored as
+    # an ISO string, which metadata $gte can't compare.
+    query_filter: Dict = {"user_id": {"$eq": user_id}}
+    if status is not None:
+        query_filter["status"] = {"$eq": status}
+
     result = index.query(
         namespace="appointments",
         vector=DUMMY_VECTOR,
         top_k=limit,
-        filter={"user_id": {"$eq": user_id}},
+        filter=query_filter,
         include_values=False,
         include_metadata=True,
     )
@@ -159,20 +313,62 @@ def get_appointments_for_user(
         appointments.append(_stored_appointment_from_metadata(md))
 
     appointments.sort(key=lambda a: a.start_time)
+
+    _cache_put(cache_key, appointments)
     return appointments
 
 
+def get_appointments_for_users(
+    user_ids: List[str],
+    per_user_limit: int = 50,
+    status: Optional[str] = None,
+) -> Dict[str, List[StoredAppointment]]:
+    """
+    Fetch appointments for several users in one Pinecone query via an
+    $in filter, for admin/bulk views — one RPC instead of one per user.
+    Returns {user_id: appointments sorted by start_time}; users with no
+    appointments map to an empty list.
+    """
+    if not user_ids:
+        return {}
+
+    query_filter: Dict = {"user_id": {"$in": user_ids}}
+    if status is not None:
+        query_filter["status"] = {"$eq": status}
+
+    result = index.query(
+        namespace="appointments",
+        vector=DUMMY_VECTOR,
+        top_k=per_user_limit * len(user_ids),
+        filter=query_filter,
+        include_values=False,
+        include_metadata=True,
+    )
+
+    buckets: Dict[str, List[StoredAppointment]] = {uid: [] for uid in user_ids}
+    for match in result.get("matches") or []:
+        md = match.get("metadata") or {}
+        if md.get("type") != "appointment":
+            continue
+        bucket = buckets.get(md.get("user_id"))
+        if bucket is not None:
+            bucket.append(_stored_appointment_from_metadata(md))
+
+    for appointments in buckets.values():
+        appointments.sort(key=lambda a: a.start_time)
+
+    return buckets
+
+
 def get_latest_confirmed_future_appointment(
     user_id: str,
     limit: int = 50
 ) -> Optional[StoredAppointment]:
-    appointments = get_appointments_for_user(user_id, limit=limit)
+    appointments = get_appointments_for_user(
+        user_id, limit=limit, status="confirmed"
+    )
 
+    # appointments is already sorted by start_time, so the first one at
+    # or after now is the answer — no filtered copy or re-sort needed.
     now = datetime.now(IST)
-    future = [
-        a for a in appointments
-        if a.status == "confirmed" and a.start_time >= now
-    ]
-
-    future.sort(key=lambda a: a.start_time)
-    return future[0] if future else None
+    return next((a for a in appointments if a.start_time >= now), None)
@@ -2,7 +2,17 @@
 
 import os
 from dotenv import load_dotenv
-from pinecone import Pinecone, ServerlessSpec
+from pinecone import ServerlessSpec
+
+# Prefer the gRPC client: it multiplexes calls over one HTTP/2
+# connection instead of paying a TLS handshake per REST request, which
+# cuts per-call latency on the upsert/query hot paths. Same .upsert/
+# .query signatures, so nothing downstream changes. Fall back to REST
+# when the grpc extra isn't installed.
+try:
+    from pinecone.grpc import PineconeGRPC as _PineconeClient
+except ImportError:
+    from pinecone import Pinecone as _PineconeClient
 
 load_dotenv()
 
@@ -10,7 +20,7 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 if not PINECONE_API_KEY:
     raise RuntimeError("ERROR: PINECONE_API_KEY is missing.")
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
+pc = _PineconeClient(api_key=PINECONE_API_KEY)
 
 # -------------------------------------------------
 # Index configs
@@ -32,8 +42,18 @@ SPEC = ServerlessSpec(
 # Helper: create index if missing
 # -------------------------------------------------
 
+# One list_indexes() round trip shared by all ensure_index calls,
+# instead of one per index on every process start. Resolved lazily so
+# PINECONE_SKIP_ENSURE deployments never pay it.
+_known_indexes: set | None = None
+
+
 def ensure_index(name: str, dimension: int):
-    if name in pc.list_indexes().names():
+    global _known_indexes
+    if _known_indexes is None:
+        _known_indexes = set(pc.list_indexes().names())
+
+    if name in _known_indexes:
         return
 
     pc.create_index(
@@ -42,14 +62,34 @@ def ensure_index(name: str, dimension: int):
         metric="cosine",
         spec=SPEC,
     )
+    _known_indexes.add(name)
+
+def wait_for_upsert(async_result):
+    """
+    Wait on an `async_req=True` upsert and re-raise any failure.
+
+    The two clients hand back different future types: REST returns
+    multiprocessing's ApplyResult (waited with .get()), gRPC returns a
+    concurrent.futures Future (waited with .result(), no .get()).
+    Callers go through here so they work under either client.
+    """
+    waiter = getattr(async_result, "result", None)
+    if waiter is None:
+        waiter = async_result.get
+    return waiter()
+
 
 # -------------------------------------------------
 # Ensure all indexes exist
 # -------------------------------------------------
 
-ensure_index(APPOINTMENT_INDEX, APPOINTMENT_DIM)
-ensure_index(CLINIC_KNOWLEDGE_INDEX, EMBEDDING_DIM)
-ensure_index(GENERAL_KNOWLEDGE_INDEX, EMBEDDING_DIM)
+# The indexes only need creating once per environment, not re-checking
+# on every worker start; set PINECONE_SKIP_ENSURE=1 in deployments where
+# they are known to exist to skip the startup round trip entirely.
+if os.getenv("PINECONE_SKIP_ENSURE") != "1":
+    ensure_index(APPOINTMENT_INDEX, APPOINTMENT_DIM)
+    ensure_index(CLINIC_KNOWLEDGE_INDEX, EMBEDDING_DIM)
+    ensure_index(GENERAL_KNOWLEDGE_INDEX, EMBEDDING_DIM)
 
 # -------------------------------------------------
 # Export index handles
@@ -2,28 +2,37 @@
 
 from __future__ import annotations
 
+from collections import defaultdict, deque
 from fastapi import HTTPException, Request, status
 import time
-from typing import Dict, List
+from typing import Deque, Dict
 
 MAX_REQUESTS = 10
 WINDOW_SECONDS = 60
 
-# { ip: [timestamps] }
-REQUEST_LOG: Dict[str, List[float]] = {}
+# { ip: deque of timestamps, oldest first }
+REQUEST_LOG: Dict[str, Deque[float]] = defaultdict(deque)
 
 
-def rate_limiter(request: Request):
+async def rate_limiter(request: Request):
     """
     Naive in-memory rate limiter.
     Limits each IP to MAX_REQUESTS per WINDOW_SECONDS.
+
+    async so FastAPI resolves it on the event loop directly; as a sync
+    dependency it cost a run_in_threadpool hop per request (every
+    endpoint depends on it), and the body never blocks.
     """
     ip = request.client.host
     now = time.time()
 
-    timestamps = REQUEST_LOG.get(ip, [])
-    # keep only calls within the defined window
-    timestamps = [t for t in timestamps if now - t < WINDOW_SECONDS]
+    # Timestamps arrive in order, so only the expired prefix needs
+    # trimming: popleft is O(expired) with no list reallocation, where
+    # the old filter-comprehension rescanned and copied every entry on
+    # every request.
+    timestamps = REQUEST_LOG[ip]
+    while timestamps and now - timestamps[0] >= WINDOW_SECONDS:
+        timestamps.popleft()
 
     if len(timestamps) >= MAX_REQUESTS:
         raise HTTPException(
@@ -32,4 +41,3 @@ def rate_limiter(request: Request):
         )
 
     timestamps.append(now)
-    REQUEST_LOG[ip] = timestamps
@@ -1,13 +1,17 @@
 # backend/main.py
 
 from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any
 from app.rate_limit import rate_limiter
 import asyncio
+import json
+import time
 import uuid
-from app.llm.agent import reset_violation_state, retrieve_rag_context
+from app.llm.agent import SessionDeps, retrieve_rag_context
+from app.persistence import clear_lookup_cache
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -23,7 +27,7 @@ from app.llm.agent import (
     Appointment as BookingAppointment,  # <-- Week 1 Appointment (name, date, time, etc.)
     dental_booking_agent,
     check_appointment_slot_available,
-    appointmentDetails,
+    get_last_appointment_details,
 )
 
 # Week 3 models + infra
@@ -54,17 +58,67 @@ class ChatRequest(BaseModel):
 # Session-based chat history (in-memory)
 session_histories: Dict[str, List[Any]] = {}
 
+# Per-session agent state (moderation counters etc.); one SessionDeps
+# per session_id so users never share or poison each other's counters.
+session_deps: Dict[str, SessionDeps] = {}
+
+# Sessions used to live forever, so abandoned conversations accumulated
+# without bound. Track last activity and opportunistically drop sessions
+# idle past the TTL on each /chat. (Still in-process state — a shared
+# store like Redis would be the move if this ever runs multi-worker.)
+SESSION_TTL_SECONDS = 3600
+
+session_last_seen: Dict[str, float] = {}
+
+# Serialize turns within one session so two concurrent requests with the
+# same session_id can't interleave history writes.
+session_locks: Dict[str, asyncio.Lock] = {}
+
+
+def _prune_idle_sessions(now: float) -> None:
+    expired = [
+        sid
+        for sid, seen in session_last_seen.items()
+        if now - seen > SESSION_TTL_SECONDS
+    ]
+    for sid in expired:
+        session_histories.pop(sid, None)
+        session_deps.pop(sid, None)
+        session_last_seen.pop(sid, None)
+        session_locks.pop(sid, None)
+
+
+def _build_final_input(message: str) -> str:
+    """Prefix the user message with retrieved RAG context, if any."""
+    rag_context = retrieve_rag_context(message)
+
+    if not rag_context:
+        return message
+
+    context_block = "\n".join(f"- {c}" for c in rag_context)
+    return (
+        "CONTEXT:\n"
+        f"{context_block}\n\n"
+        "USER QUESTION:\n"
+        f"{message}"
+    )
+
 
 @app.post("/chat", dependencies=[Depends(rate_limiter)])
-def chat(req: ChatRequest):
+async def chat(req: ChatRequest):
     try:
         # 1️⃣ Create or reuse session
         session_id = req.session_id or str(uuid.uuid4())
 
+        now = time.time()
+        _prune_idle_sessions(now)
+        session_last_seen[session_id] = now
+
         if session_id not in session_histories:
             session_histories[session_id] = []
 
-        history = session_histories[session_id]
+        # One turn at a time per session; other sessions proceed freely
+        session_lock = session_locks.setdefault(session_id, asyncio.Lock())
 
         logger.info(
         "[CHAT] session_id=%s | user_message=%s",
@@ -73,37 +127,37 @@ def chat(req: ChatRequest):
 )
 
 
-        # 2️⃣ Append user message
-        history.append({"role": "user", "content": req.message})
-
-        # 3️⃣ RAG retrieval + context injection
-        rag_context = retrieve_rag_context(req.message)
+        # 3️⃣ RAG retrieval + context injection. Offloaded: a cold RAG
+        # lookup is a blocking embedding POST plus Pinecone queries, which
+        # would stall the event loop if run inline here.
+        final_input = await asyncio.to_thread(_build_final_input, req.message)
+
+        # 4️⃣ Run agent. to_thread keeps the event loop free to serve
+        # other requests during the seconds-long LLM round trip (the old
+        # sync handler pinned a threadpool slot and blocked concurrent
+        # endpoints behind it).
+        async with session_lock:
+            history = session_histories[session_id]
+            history.append({"role": "user", "content": req.message})
+
+            result = await asyncio.to_thread(
+                agent.run_sync,
+                final_input,
+                message_history=history,
+                deps=session_deps.setdefault(session_id, SessionDeps()),
+            )
 
-        if rag_context:
-            context_block = "\n".join(f"- {c}" for c in rag_context)
-            final_input = (
-                "CONTEXT:\n"
-                f"{context_block}\n\n"
-                "USER QUESTION:\n"
-                f"{req.message}"
+            logger.info(
+            "[CHAT] session_id=%s | assistant_reply=%s",
+            session_id,
+            result.output,
             )
-        else:
-            final_input = req.message
 
-        # 4️⃣ Run agent
-        result = agent.run_sync(
-            final_input,
-            message_history=history,
-        )
+            # Per-turn lookup cache: fresh per request, cached within it
+            clear_lookup_cache()
 
-        logger.info(
-        "[CHAT] session_id=%s | assistant_reply=%s",
-        session_id,
-        result.output,
-        )
-
-        # 5️⃣ Store updated history
-        session_histories[session_id] = result.all_messages()
+            # 5️⃣ Store updated history
+            session_histories[session_id] = result.all_messages()
 
         logger.info(
         "[CHAT] session_id=%s | history_length=%d",
@@ -121,6 +175,73 @@ def chat(req: ChatRequest):
         return {"error": str(e)}
 
 
+@app.post("/chat/stream", dependencies=[Depends(rate_limiter)])
+async def chat_stream(req: ChatRequest):
+    """
+    Streaming variant of /chat using Server-Sent Events. Tokens flush as
+    the model yields them, so time-to-first-byte is first-token latency
+    instead of the full multi-tool turn. Same session semantics as /chat;
+    the frontend reads `delta` events and a final `done` event carrying
+    the session_id.
+    """
+    session_id = req.session_id or str(uuid.uuid4())
+
+    now = time.time()
+    _prune_idle_sessions(now)
+    session_last_seen[session_id] = now
+
+    if session_id not in session_histories:
+        session_histories[session_id] = []
+
+    session_lock = session_locks.setdefault(session_id, asyncio.Lock())
+
+    logger.info(
+        "[CHAT-STREAM] session_id=%s | user_message=%s",
+        session_id,
+        req.message,
+    )
+
+    # Offloaded for the same reason as /chat: a cold RAG lookup blocks
+    # on an embedding POST and Pinecone queries, which would delay every
+    # concurrent stream if run on the event loop.
+    final_input = await asyncio.to_thread(_build_final_input, req.message)
+
+    async def event_generator():
+        # The lock is taken inside the generator because StreamingResponse
+        # runs it after this handler returns; history must stay untouched
+        # by other turns for the whole stream, not just the setup.
+        async with session_lock:
+            history = session_histories[session_id]
+            history.append({"role": "user", "content": req.message})
+
+            try:
+                async with agent.run_stream(
+                    final_input,
+                    message_history=history,
+                    deps=session_deps.setdefault(session_id, SessionDeps()),
+                ) as result:
+                    async for delta in result.stream_text(delta=True):
+                        yield f"data: {json.dumps({'delta': delta})}\n\n"
+
+                    # Persist history only once the turn fully completed;
+                    # a client disconnect mid-stream leaves the session at
+                    # its pre-turn state instead of half a turn.
+                    session_histories[session_id] = result.all_messages()
+
+                yield f"data: {json.dumps({'done': True, 'session_id': session_id})}\n\n"
+            except Exception as e:
+                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            finally:
+                if session_histories.get(session_id) is history:
+                    # Stream aborted before completing: drop the user
+                    # message appended above so the session rolls back
+                    # to its pre-turn state.
+                    history.pop()
+                clear_lookup_cache()
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+
 
 
 # ---------- Week 1 booking endpoints stay as-is ----------
@@ -134,15 +255,22 @@ class BookingRequest(BaseModel):
     contact_phone: Optional[str] = None
 
 
-@app.post("/book", dependencies=[Depends(rate_limiter)])
-async def book(b: BookingRequest):
-    """Directly call the Week 1 dental_booking_agent tool with validated booking data."""
+class BookingFlow(BookingRequest):
+    """BookingRequest plus the action to take on it."""
+    action: Literal["check", "book"] = "check"
+
+
+def _run_booking_action(b: BookingRequest, action: str) -> Dict[str, Any]:
+    """
+    Shared body of /book, /check_slot and /book_or_check: validate the
+    booking payload into the Week 1 Appointment once, then dispatch.
+    """
     try:
         appointment = BookingAppointment(
-            name=b.name,
+            name=b.name or "",
             preferred_date=b.preferred_date,
             time=b.time,
-            reason=b.reason,
+            reason=b.reason or "",
             contact_email=b.contact_email,
             contact_phone=b.contact_phone,
         )
@@ -150,32 +278,33 @@ async def book(b: BookingRequest):
         return {"success": False, "error": f"Validation error: {e}"}
 
     try:
-        result = dental_booking_agent(None, appointment)
-        return {"success": True, "result": result}
+        if action == "book":
+            return {"success": True, "result": dental_booking_agent(None, appointment)}
+        return {"success": True, "status": check_appointment_slot_available(appointment)}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
+@app.post("/book_or_check", dependencies=[Depends(rate_limiter)])
+async def book_or_check(b: BookingFlow):
+    """
+    Unified booking endpoint: one validated payload, branched on
+    `action` ("check" | "book"), so the check-then-book UI flow doesn't
+    re-validate an identical body across two endpoints.
+    """
+    return _run_booking_action(b, b.action)
+
+
+@app.post("/book", dependencies=[Depends(rate_limiter)])
+async def book(b: BookingRequest):
+    """Directly call the Week 1 dental_booking_agent tool with validated booking data."""
+    return _run_booking_action(b, "book")
+
+
 @app.post("/check_slot", dependencies=[Depends(rate_limiter)])
 async def check_slot(b: BookingRequest):
     """Check availability for the requested time slot using the Week 1 agent's plain tool."""
-    try:
-        appointment = BookingAppointment(
-            name=b.name or "",
-            preferred_date=b.preferred_date,
-            time=b.time,
-            reason=b.reason or "",
-            contact_email=b.contact_email,
-            contact_phone=b.contact_phone,
-        )
-    except Exception as e:
-        return {"success": False, "error": f"Validation error: {e}"}
-
-    try:
-        status_text = check_appointment_slot_available(appointment)
-        return {"success": True, "status": status_text}
-    except Exception as e:
-        return {"success": False, "error": str(e)}
+    return _run_booking_action(b, "check")
 
 
 @app.get("/appointment")
@@ -184,19 +313,23 @@ async def get_latest_appointment():
     Return the last booked appointment details (in-memory).
     This is Week 1 behavior, kept for demo/testing.
     """
-    return {"appointmentDetails": appointmentDetails}
+    return {"appointmentDetails": get_last_appointment_details()}
 
 
 @app.post("/reset")
 async def reset_chat(session_id: Optional[str] = None):
     if session_id and session_id in session_histories:
         session_histories.pop(session_id, None)
-        reset_violation_state()
+        session_deps.pop(session_id, None)
+        session_last_seen.pop(session_id, None)
+        session_locks.pop(session_id, None)
         return {"status": "session_reset"}
 
     # fallback: reset everything (dev only)
     session_histories.clear()
-    reset_violation_state()
+    session_deps.clear()
+    session_last_seen.clear()
+    session_locks.clear()
     return {"status": "all_sessions_reset"}
 
 
@@ -220,20 +353,25 @@ async def create_appointment(appt: StoredAppointment):
     if not appt.id:
         appt.id = str(uuid.uuid4())
 
+    # The three network calls are inherently sequential (check gates the
+    # create, the create produces the event id the save stores), but each
+    # is offloaded so this async handler doesn't block the event loop for
+    # the combined round-trip time.
+
     # Check slot against Google Calendar
-    if not is_slot_free(appt.start_time, appt.end_time):
+    if not await asyncio.to_thread(is_slot_free, appt.start_time, appt.end_time):
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="Requested time slot is not available. Please choose another time.",
         )
 
     # Create calendar event
-    event_id = create_calendar_event(appt)
+    event_id = await asyncio.to_thread(create_calendar_event, appt)
     appt.google_event_id = event_id
     appt.status = "confirmed"
 
     # Save in Pinecone
-    save_stored_appointment(appt)
+    await asyncio.to_thread(save_stored_appointment, appt)
 
     return appt
 
@@ -248,7 +386,9 @@ async def list_appointments(user_id: str, limit: int = 50):
     Week 3 endpoint:
       List appointments for a given user_id using Pinecone metadata filter.
     """
-    return get_appointments_for_user(user_id=user_id, limit=limit)
+    return await asyncio.to_thread(
+        get_appointments_for_user, user_id=user_id, limit=limit
+    )
 
 
 if __name__ == "__main__":
@@ -17,9 +17,14 @@ try:
 except Exception:
     KOLKATA = timezone(timedelta(hours=5, minutes=30))
 
+# Compiled once at module load instead of per validation call
+_ORDINAL_RE = re.compile(r'(\d+)(st|nd|rd|th)\b')
+_PHONE_RE = re.compile(r"[6-9]\d{9}")  # Indian 10-digit number starting 6–9; matched with fullmatch
+
+
 def _normalize_input(s: str) -> str:
     s = (s or "").strip().lower()
-    s = re.sub(r'(\d+)(st|nd|rd|th)\b', r'\1', s)
+    s = _ORDINAL_RE.sub(r'\1', s)
     s = s.replace(',', '')
     return s
 
@@ -87,8 +92,7 @@ class Appointment(BaseModel):
     def validate_phone(cls, v):
         if v is None:
             return v  # optional
-        pattern = re.compile(r"^[6-9]\d{9}$")  # Indian 10-digit number starting 6–9
-        if not pattern.match(v):
+        if not _PHONE_RE.fullmatch(v):
             raise ValueError("Invalid phone number format. Must be a 10-digit Indian mobile number starting with 6–9.")
         return v
 
@@ -128,6 +132,14 @@ appointmentSlots = {'11:30AM':"Available",
                     '4:00PM':"Unavailable",
                     '5:00PM':"Available"}
 
+# Precomputed once so the "slot not found" reply doesn't rebuild the
+# available list (or re-concatenate the message) on every miss. A tuple,
+# not a set, so the message lists slots in appointmentSlots order. Keep
+# in sync if appointmentSlots mutates.
+AVAILABLE_SLOTS = tuple(t for t, s in appointmentSlots.items() if s == "Available")
+AVAILABLE_SLOTS_STR = ", ".join(AVAILABLE_SLOTS)
+SLOT_NOT_AVAILABLE_MSG = "Slot not available. Available slots are: " + AVAILABLE_SLOTS_STR
+
 appointmentDetails = {}
 
 
@@ -161,8 +173,7 @@ def dental_booking_agent(ctx: RunContext[None], appointment: Appointment) -> str
 @agent.tool_plain
 def check_appointment_slot_available(time: str) -> str:
     if time not in appointmentSlots:
-        available_slots = [t for t, status in appointmentSlots.items() if status == "Available"]
-        return "Slot not available. Available slots are: " + ", ".join(available_slots)
+        return SLOT_NOT_AVAILABLE_MSG
 
     status = appointmentSlots[time]
     if status == "Available":
@@ -187,7 +198,9 @@ if __name__ == "__main__":
             break
         else:
             result = agent.run_sync(query, message_history=msg_history)
-            msg_history = result.all_messages()
+            # Append only this turn's messages instead of copying the
+            # whole history each turn
+            msg_history.extend(result.new_messages())
             print(result.output)
 
     print(" Bye ")
\ No newline at end of file